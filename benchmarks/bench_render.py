@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+""" Measure the effect of the compiled template cache in render_meta_yaml.
+
+Reports the time to render a meta.yaml with and without a compiled
+template, and the number of Jinja2 compiles made by the rendering patterns
+used in the package:
+
+* create_clobber renders each subdir twice, keeping and dropping lines with
+  undecidable selectors.  Subdirs and modes often select the same text.
+* CondaRecipe renders its text once per edit.  Every edit changes the text,
+  so these renders never reuse a compiled template.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+from conda_recipe_tools import recipe
+from conda_recipe_tools.cli.create_clobber import DEFAULT_SUBDIRS
+from conda_recipe_tools.recipe import CondaRecipe, render_for_subdir
+
+DEFAULT_RECIPE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'fixtures', 'recipes', 'meta.yaml')
+
+
+class _CountingEnvironment(object):
+    """ Wrap a Jinja2 environment, counting the templates compiled. """
+
+    def __init__(self, env):
+        self.env = env
+        self.compiles = 0
+
+    def from_string(self, text):
+        self.compiles += 1
+        return self.env.from_string(text)
+
+
+def count_compiles(func):
+    """ Return (renders, compiles) made by func with an empty cache. """
+    recipe._template_cache.clear()
+    counter = _CountingEnvironment(recipe._JINJA_ENV)
+    renders = [0]
+    original_env = recipe._JINJA_ENV
+    original_get = recipe._get_template
+
+    def get_template(text):
+        renders[0] += 1
+        return original_get(text)
+
+    recipe._JINJA_ENV = counter
+    recipe._get_template = get_template
+    try:
+        func()
+    finally:
+        recipe._JINJA_ENV = original_env
+        recipe._get_template = original_get
+    return renders[0], counter.compiles
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the compiled template cache of render_meta_yaml')
+    parser.add_argument(
+        'meta', nargs='?', default=DEFAULT_RECIPE,
+        help='meta.yaml to render, default ' + DEFAULT_RECIPE)
+    parser.add_argument(
+        '--repeat', '-r', type=int, default=200,
+        help='number of renders timed, default 200')
+    args = parser.parse_args()
+    with open(args.meta) as fh:
+        text = fh.read()
+
+    def compile_and_render():
+        recipe._JINJA_ENV.from_string(text).render(os=os)
+
+    def render_cached():
+        recipe._get_template(text).render(os=os)
+
+    compile_time = timeit.timeit(
+        compile_and_render, number=args.repeat) / args.repeat
+    recipe._get_template(text)
+    cached_time = timeit.timeit(
+        render_cached, number=args.repeat) / args.repeat
+    print('compile and render: {:8.3f} ms'.format(compile_time * 1000))
+    print('render cached:      {:8.3f} ms'.format(cached_time * 1000))
+
+    def clobber():
+        for subdir in DEFAULT_SUBDIRS:
+            for undecidable in (True, False):
+                render_for_subdir(text, subdir, undecidable)
+
+    def edit():
+        meta = CondaRecipe.from_text(text)
+        meta.version
+        meta.update(version='99.0', hash_value='ab' * 32, build_number=1)
+        meta.update(build_number=2)
+
+    for label, func in [('create_clobber', clobber), ('CondaRecipe', edit)]:
+        renders, compiles = count_compiles(func)
+        print('{:<15} {} renders, {} compiles'.format(
+            label + ':', renders, compiles))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+""" Compare streamed anchor extraction against BeautifulSoup.
+
+find_version extracts the links from index pages with a regular expression
+applied to the page as it is streamed (_iter_anchors) rather than parsing
+the page with BeautifulSoup.  This script checks that both give the same
+(href, text) pairs for a collection of index pages, with the page split into
+chunks of various sizes, and reports the time taken by each approach.
+
+The pages in fixtures/index_pages reproduce the markup of the index pages
+the url, tbb and graphviz version sources read: Apache and nginx directory
+listings, a PyPI simple page, a GitHub releases page and the graphviz
+download page.  Other pages can be checked by passing their paths.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup, NavigableString
+
+from conda_recipe_tools.find_version import _CHUNK_SIZE, _iter_anchors
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'index_pages')
+CHUNK_SIZES = [1, 7, 100, 4096, _CHUNK_SIZE]
+
+
+def _chunks(content, chunk_size):
+    return [content[i:i+chunk_size]
+            for i in range(0, len(content), chunk_size)]
+
+
+def streamed_anchors(content, chunk_size=_CHUNK_SIZE):
+    return list(_iter_anchors(_chunks(content, chunk_size)))
+
+
+def soup_anchors(content):
+    # text is the text before the first child tag, as matched by _iter_anchors
+    soup = BeautifulSoup(content, 'lxml')
+    anchors = []
+    for link in soup.find_all('a', href=True):
+        first = link.contents[0] if link.contents else ''
+        text = first if isinstance(first, NavigableString) else ''
+        anchors.append((link['href'].strip(), str(text).strip()))
+    return anchors
+
+
+def compare(path, repeat):
+    with open(path, 'rb') as fh:
+        content = fh.read()
+    expected = soup_anchors(content)
+    ok = True
+    for chunk_size in CHUNK_SIZES:
+        found = streamed_anchors(content, chunk_size)
+        if found != expected:
+            ok = False
+            missing = [a for a in expected if a not in found]
+            extra = [a for a in found if a not in expected]
+            print('  MISMATCH chunk size {}: {} missing, {} extra'.format(
+                chunk_size, len(missing), len(extra)))
+            for anchor in missing[:5]:
+                print('    missing:', anchor)
+            for anchor in extra[:5]:
+                print('    extra:', anchor)
+    soup_time = timeit.timeit(
+        lambda: soup_anchors(content), number=repeat) / repeat
+    stream_time = timeit.timeit(
+        lambda: streamed_anchors(content), number=repeat) / repeat
+    print('{:<24} {:>6} anchors {:>8.1f} KB  bs4 {:>8.3f} ms  '
+          'streamed {:>8.3f} ms  {}'.format(
+              os.path.basename(path), len(expected), len(content) / 1024,
+              soup_time * 1000, stream_time * 1000,
+              'ok' if ok else 'MISMATCH'))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare streamed anchor extraction with BeautifulSoup')
+    parser.add_argument(
+        'pages', nargs='*',
+        help='HTML pages to compare, default is the pages in ' + FIXTURE_DIR)
+    parser.add_argument(
+        '--repeat', '-r', type=int, default=20,
+        help='number of times each page is parsed when timing, default 20')
+    args = parser.parse_args()
+    pages = args.pages or sorted(
+        glob.glob(os.path.join(FIXTURE_DIR, '*.html')))
+    results = [compare(page, args.repeat) for page in pages]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
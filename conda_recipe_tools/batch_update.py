@@ -0,0 +1,145 @@
+""" Update many recipes in a single process. """
+
+import csv
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from conda_recipe_tools.recipe import CondaRecipe, find_hashes
+from conda_recipe_tools.util import write_json_atomic
+
+
+def read_batch_csv(csv_filename):
+    """
+    Read a batch of updates from a CSV file.
+
+    The file must have feedstock and version columns and may have a hash
+    column.  Lines starting with # are ignored.
+
+    Returns
+    -------
+    rows : list of dict
+        Dictionaries with feedstock, version and hash keys, hash is None when
+        not given.
+
+    """
+    rows = []
+    with open(csv_filename) as csvfile:
+        reader = csv.DictReader(filter(lambda x: x[0] != "#", csvfile))
+        for row in reader:
+            rows.append({
+                'feedstock': row['feedstock'].strip().rstrip('/'),
+                'version': row['version'].strip(),
+                'hash': (row.get('hash') or '').strip() or None,
+            })
+    return rows
+
+
+def _meta_path(base_dir, feedstock):
+    return os.path.join(base_dir, feedstock, 'recipe', 'meta.yaml')
+
+
+def _set_version(meta_path, version):
+    """ Return (recipe, status, reason) after updating the version. """
+    try:
+        recipe = CondaRecipe(meta_path)
+        if str(recipe.version) == version:
+            return None, 'unchanged', 'recipe already at version'
+        recipe.update(version=version)
+        # render now so the parsed recipe is returned from the worker
+        if recipe.url is None:
+            return None, 'failed', 'recipe has no source url'
+        if recipe.hash_type is None:
+            return None, 'failed', 'recipe has no source hash'
+    except Exception as exc:
+        return None, 'failed', '{}: {}'.format(type(exc).__name__, exc)
+    return recipe, None, None
+
+
+def _finish_update(recipe, meta_path, hash_value, build_number):
+    """ Set the hash and build number and write the recipe. """
+    try:
+        recipe.update(hash_value=hash_value, build_number=build_number)
+        recipe.write(meta_path)
+    except Exception as exc:
+        return 'failed', '{}: {}'.format(type(exc).__name__, exc)
+    return 'updated', None
+
+
+def update_recipes(rows, base_dir='.', build_number=0, max_workers=None,
+                   download_workers=8):
+    """
+    Update a batch of recipes.
+
+    Versions are set in a process pool, source hashes not given in the rows
+    are resolved with concurrent downloads, then hashes and build numbers
+    are set and the recipes written in the process pool.
+
+    Parameters
+    ----------
+    rows : list of dict
+        Updates to make, see read_batch_csv.
+    base_dir : str
+        Directory containing the feedstocks.
+    build_number : int
+        Build number to set in the updated recipes.
+    max_workers : int or None
+        Number of processes used to edit recipes, None for the number of
+        processors.
+    download_workers : int
+        Number of concurrent source downloads.
+
+    Returns
+    -------
+    results : list of dict
+        A dictionary for each row with feedstock, version, status and reason
+        keys.  status is one of updated, unchanged or failed, reason explains
+        the status when the recipe was not updated.
+
+    """
+    results = [
+        {'feedstock': row['feedstock'], 'version': row['version'],
+         'status': None, 'reason': None} for row in rows]
+    meta_paths = [_meta_path(base_dir, row['feedstock']) for row in rows]
+    versions = [row['version'] for row in rows]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        staged = list(executor.map(_set_version, meta_paths, versions))
+        recipes = [recipe for recipe, _, _ in staged]
+        for result, (_, status, reason) in zip(results, staged):
+            result['status'], result['reason'] = status, reason
+
+        # resolve missing hashes concurrently
+        hashes = [row['hash'] for row in rows]
+        need_hash = [i for i, recipe in enumerate(recipes)
+                     if recipe is not None and hashes[i] is None]
+        found = find_hashes(
+            [recipes[i] for i in need_hash], max_workers=download_workers)
+        for i, hash_value in zip(need_hash, found):
+            if hash_value is None:
+                results[i]['status'] = 'failed'
+                results[i]['reason'] = 'could not determine source hash'
+                recipes[i] = None
+            hashes[i] = hash_value
+
+        to_finish = [i for i, recipe in enumerate(recipes)
+                     if recipe is not None]
+        finished = executor.map(
+            _finish_update,
+            [recipes[i] for i in to_finish],
+            [meta_paths[i] for i in to_finish],
+            [hashes[i] for i in to_finish],
+            [build_number] * len(to_finish))
+        for i, (status, reason) in zip(to_finish, finished):
+            results[i]['status'], results[i]['reason'] = status, reason
+
+    for result in results:
+        if result['status'] == 'failed':
+            logging.warning('update failed: {} ({})'.format(
+                result['feedstock'], result['reason']))
+    return results
+
+
+def write_results(results, filename):
+    """ Write the results of update_recipes to a JSON file. """
+    write_json_atomic(results, filename, indent=1)
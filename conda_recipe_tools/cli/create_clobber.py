@@ -5,25 +5,75 @@ import logging
 import os.path
 import sys
 from collections import defaultdict
-
-from conda_build.api import render
+from concurrent.futures import ProcessPoolExecutor
 
 import yaml
 
+from conda_recipe_tools.recipe import UndecidableRecipe, render_for_subdir
 from conda_recipe_tools.util import get_feedstock_dirs
 
 LOG_FORMAT = '%(asctime)s - %(levelname)s : %(message)s'
+DEFAULT_SUBDIRS = ['linux-64', 'osx-64', 'win-64']
 
 
-def prep_clobber(feedstock_dir):
-    """ create a recipe_clobber.yaml file for a feedstock """
-
-    recipe_dir = os.path.join(feedstock_dir, 'recipe')
+def _clobber_fields_conda_build(recipe_dir):
+    """ build number and noarch python of a recipe rendered by conda-build """
+    # conda-build is slow to import and render, only use it when needed
+    from conda_build.api import render
     recipes = render(recipe_dir, finalize=False)
     metadata, download, needs_reparse = recipes[0]
-
     pkg_build_number = metadata.build_number()
     pkg_noarch_python = metadata.noarch_python or metadata.noarch == 'python'
+    return pkg_build_number, pkg_noarch_python
+
+
+def _clobber_fields(text, subdirs):
+    """
+    build number and noarch python of a recipe which must agree across all
+    subdirs, raises UndecidableRecipe otherwise.
+
+    Selectors which depend on more than the platform, for example
+    ``skip: true  # [py<36]``, are ignored unless keeping or removing their
+    lines changes the fields.
+    """
+    fields = set()
+    for subdir in subdirs:
+        for undecidable in (True, False):
+            parsed = render_for_subdir(text, subdir, undecidable) or {}
+            build = parsed.get('build') or {}
+            try:
+                build_number = int(build.get('number', 0))
+            except (TypeError, ValueError):
+                raise UndecidableRecipe(
+                    'invalid build number: {}'.format(build.get('number')))
+            noarch_python = (
+                build.get('noarch') == 'python' or
+                bool(build.get('noarch_python')))
+            fields.add((build_number, noarch_python))
+    if len(fields) != 1:
+        raise UndecidableRecipe(
+            'subdirs or selectors do not agree: {}'.format(fields))
+    return fields.pop()
+
+
+def prep_clobber(feedstock_dir, subdirs=None, use_conda_build=False):
+    """ create a recipe_clobber.yaml file for a feedstock """
+
+    recipe_dir = os.path.join(feedstock_dir, 'recipe')
+    if subdirs is None:
+        subdirs = DEFAULT_SUBDIRS
+    if use_conda_build:
+        fields = _clobber_fields_conda_build(recipe_dir)
+    else:
+        with open(os.path.join(recipe_dir, 'meta.yaml')) as f:
+            text = f.read()
+        try:
+            fields = _clobber_fields(text, subdirs)
+        except UndecidableRecipe as exc:
+            logging.info(
+                'falling back to conda-build for %s: %s', feedstock_dir, exc)
+            fields = _clobber_fields_conda_build(recipe_dir)
+    pkg_build_number, pkg_noarch_python = fields
 
     clobber = defaultdict(dict)
     # clobber noarch: python if present
@@ -52,6 +102,16 @@ def main():
     parser.add_argument(
         '--base_dir', default='.', type=str,
         help='feedstock base directory, default is current directory')
+    parser.add_argument(
+        '--subdirs', nargs='+', default=DEFAULT_SUBDIRS,
+        help=('subdirs used to evaluate selectors, default is '
+              + ' '.join(DEFAULT_SUBDIRS)))
+    parser.add_argument(
+        '--conda-build', action='store_true', dest='conda_build',
+        help='always render recipes with conda-build')
+    parser.add_argument(
+        '--jobs', '-j', default=None, type=int,
+        help='number of worker processes, default is the number of CPUs')
     parser.add_argument(
         '--log', default='info',
         help='log level; debug, info, warning, error, critical')
@@ -64,12 +124,21 @@ def main():
     logging.basicConfig(level=log_numeric_level, format=LOG_FORMAT)
 
     feedstock_dirs = get_feedstock_dirs(args.feedstock_dir, args.file)
-    for feedstock_dir in feedstock_dirs:
-        if feedstock_dir.endswith('/'):
-            feedstock_dir = feedstock_dir[:-1]
-        logging.info('preparing files for: ' + feedstock_dir)
-        prep_clobber(feedstock_dir)
-    return 0
+    feedstock_dirs = [d[:-1] if d.endswith('/') else d for d in feedstock_dirs]
+    failed = False
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(prep_clobber, d, args.subdirs, args.conda_build)
+            for d in feedstock_dirs]
+        for feedstock_dir, future in zip(feedstock_dirs, futures):
+            logging.info('preparing files for: ' + feedstock_dir)
+            try:
+                future.result()
+            except Exception as exc:
+                logging.error(
+                    'could not prepare files for %s: %s', feedstock_dir, exc)
+                failed = True
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
@@ -2,33 +2,116 @@
 # create report with recipe diffs for a series of feedstocks
 
 import argparse
+import hashlib
+import html
+import json
+import logging
 import os.path
+import subprocess
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from jinja2 import Template
 
 from conda_recipe_tools.recipe import CondaRecipe
-from conda_recipe_tools.git import GitRepo
-from conda_recipe_tools.util import get_feedstock_dirs
+from conda_recipe_tools.git import FeedStock, GitRepo, NotFeedstockRepo
+from conda_recipe_tools.repodata import CRT_CACHE_DIR
+from conda_recipe_tools.util import (
+    get_feedstock_dirs, open_atomic, write_json_atomic)
 
 from pygments import highlight
 from pygments.lexers import DiffLexer
 from pygments.formatters import HtmlFormatter
 
+DEFAULT_CACHE_DIR = os.path.join(CRT_CACHE_DIR, 'diff_fragments')
+# cached diffs not used in this many days are removed
+DEFAULT_CACHE_MAX_AGE = 30
+# entry fields which only depend on the commits being compared
+CACHED_FIELDS = ('pkg_name', 'version', 'diff_cf_html', 'diff_origin_html')
+# layout of a paged report directory
+INDEX_FILENAME = 'index.html'
+FRAGMENTS_DIR = 'fragments'
+SEARCH_INDEX_FILENAME = 'search_index.js'
 
-def make_report(report_entries, template_filename, outfile):
+
+def make_report(report_entries, template_filename, outfile,
+                remote_org='conda-forge'):
     if template_filename is None:
         this_dir = os.path.dirname(os.path.abspath(__file__))
         template_filename = os.path.join(this_dir, 'report_template.html')
     with open(template_filename) as f:
         template_text = f.read()
     report_template = Template(template_text)
-    report_text = report_template.render(report_entries=report_entries)
+    # stream the report so that entries are written as they are created
+    stream = report_template.stream(
+        report_entries=report_entries, remote_org=remote_org)
     if outfile is None:
-        print(report_text)
+        stream.dump(sys.stdout)
     else:
-        with open(outfile, 'w') as f:
-            f.write(report_text)
+        # an incomplete report never replaces outfile
+        with open_atomic(outfile) as f:
+            stream.dump(f)
+
+
+def _write_fragments(report_entries, fragments_path, search_index, written):
+    """ write the diffs of each entry to a script, yield entries without
+
+    The filename of each script is added to written.
+    """
+    for entry in report_entries:
+        name = entry['feedstock_name']
+        written.add(name + '.js')
+        diffs = {
+            'cf': entry['diff_cf_html'],
+            'origin': entry['diff_origin_html'],
+        }
+        with open(os.path.join(fragments_path, name + '.js'), 'w') as f:
+            f.write('loadFragment({}, {});\n'.format(
+                json.dumps(name), json.dumps(diffs)))
+        search_index.append({
+            'feedstock_name': name,
+            'text': ' '.join(
+                str(entry[k]) for k in ('feedstock_name', 'pkg_name',
+                                        'version')).lower(),
+        })
+        yield {k: v for k, v in entry.items() if k not in (
+            'diff_cf_html', 'diff_origin_html')}
+
+
+def make_paged_report(report_entries, template_filename, outdir,
+                      remote_org='conda-forge'):
+    """ Write a report whose diffs are loaded when they are first shown.
+
+    outdir will contain an index page listing the entries, a script per
+    feedstock in fragments/ with its highlighted diffs and a search index
+    of feedstock names, package names and versions.  Scripts left in
+    fragments/ by earlier reports are removed once the report is written.
+    """
+    if template_filename is None:
+        this_dir = os.path.dirname(os.path.abspath(__file__))
+        template_filename = os.path.join(
+            this_dir, 'report_index_template.html')
+    with open(template_filename) as f:
+        template_text = f.read()
+    fragments_path = os.path.join(outdir, FRAGMENTS_DIR)
+    os.makedirs(fragments_path, exist_ok=True)
+    search_index = []
+    written = set()
+    index_entries = _write_fragments(
+        report_entries, fragments_path, search_index, written)
+    stream = Template(template_text).stream(
+        report_entries=index_entries,
+        fragments_dir=FRAGMENTS_DIR,
+        search_index=SEARCH_INDEX_FILENAME,
+        remote_org=remote_org)
+    with open_atomic(os.path.join(outdir, INDEX_FILENAME)) as f:
+        stream.dump(f)
+    with open_atomic(os.path.join(outdir, SEARCH_INDEX_FILENAME)) as f:
+        f.write('var searchIndex = {};\n'.format(json.dumps(search_index)))
+    for filename in os.listdir(fragments_path):
+        if filename.endswith('.js') and filename not in written:
+            os.unlink(os.path.join(fragments_path, filename))
 
 
 def get_diff_html(feedstock_path, remote_org):
@@ -42,28 +125,162 @@ def get_diff_html(feedstock_path, remote_org):
     return diff_cf_html, diff_origin_html
 
 
+def fragment_key(feedstock_path, remote_org):
+    """ Cache key of the diffs and recipe of a feedstock.
+
+    The key is derived from the HEAD, remote_org/master and origin/master
+    commit hashes.  None is returned when the recipe has uncommitted changes
+    or a ref cannot be resolved, as the diffs then cannot be cached.
+    """
+    repo = GitRepo(feedstock_path)
+    try:
+        if repo.is_dirty('recipe'):
+            return None
+        hashes = [repo.rev_parse(ref) for ref in (
+            'HEAD', f'{remote_org}/master', 'origin/master')]
+    except subprocess.CalledProcessError:
+        return None
+    return hashlib.sha256(
+        ':'.join([remote_org] + hashes).encode('utf-8')).hexdigest()
+
+
+def _read_fragment(cache_dir, key):
+    path = os.path.join(cache_dir, key + '.json')
+    try:
+        with open(path) as f:
+            fragment = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    try:
+        # mark the fragment as used so prune_fragments keeps it
+        os.utime(path)
+    except OSError:
+        pass
+    return fragment
+
+
+def prune_fragments(cache_dir, max_age):
+    """ Remove cached fragments not used in max_age seconds.
+
+    Returns the number of fragments removed.
+    """
+    removed = 0
+    if not os.path.isdir(cache_dir):
+        return removed
+    now = time.time()
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(('.json', '.tmp')):
+            continue
+        try:
+            if now - entry.stat().st_mtime > max_age:
+                os.unlink(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _read_recipe(feedstock_path, feedstock_name, at_head):
+    """ Read the recipe of a feedstock.
+
+    When at_head is True the recipe is read from the HEAD commit, the commit
+    a cached fragment is keyed on, otherwise from the working tree.
+    """
+    if at_head:
+        try:
+            with FeedStock(feedstock_path, feedstock_name) as feedstock:
+                text = feedstock.meta_yaml('HEAD')
+        except NotFeedstockRepo:
+            text = None
+        if text is not None:
+            return CondaRecipe.from_text(text)
+    return CondaRecipe(os.path.join(feedstock_path, 'recipe', 'meta.yaml'))
+
+
 def create_report_entry(
-            feedstock_name, label_prefix, concourse_url, base_dir, remote_org):
+            feedstock_name, label_prefix, concourse_url, base_dir, remote_org,
+            cache_dir=None):
+    feedstock_name = feedstock_name.rstrip('/')
     feedstock_path = os.path.join(base_dir, feedstock_name)
-    recipe_path = os.path.join(feedstock_path, 'recipe', 'meta.yaml')
-    diff_cf_html, diff_origin_html = get_diff_html(feedstock_path, remote_org)
+    key = fragment = None
+    if cache_dir is not None:
+        key = fragment_key(feedstock_path, remote_org)
+        if key is not None:
+            fragment = _read_fragment(cache_dir, key)
+    if fragment is None:
+        diff_cf_html, diff_origin_html = get_diff_html(
+            feedstock_path, remote_org)
+        recipe = _read_recipe(feedstock_path, feedstock_name, key is not None)
+        fragment = {
+            'pkg_name': recipe.name,
+            'version': recipe.version,
+            'diff_cf_html': diff_cf_html,
+            'diff_origin_html': diff_origin_html,
+        }
+        if key is not None:
+            write_json_atomic(
+                fragment, os.path.join(cache_dir, key + '.json'))
+    entry = _base_entry(
+        feedstock_name, label_prefix, concourse_url, remote_org)
+    entry.update((field, fragment[field]) for field in CACHED_FIELDS)
+    return entry
+
+
+def _base_entry(feedstock_name, label_prefix, concourse_url, remote_org):
+    """ entry fields which do not depend on the feedstock contents """
     pipeline_label = label_prefix + feedstock_name.rsplit('-', 1)[0]
-    recipe = CondaRecipe(recipe_path)
-    entry = {
-        'pkg_name': recipe.name,
+    return {
         'feedstock_name': feedstock_name,
-        'version': recipe.version,
         'concourse_url': concourse_url + '/pipeline/' + pipeline_label,
         'cf_url': f'https://github.com/{remote_org}/{feedstock_name}',
-        'diff_cf_html': diff_cf_html,
-        'diff_origin_html': diff_origin_html,
         'id_diff_cf': f'id_{feedstock_name}_diff_cf',
         'id_diff_origin': f'id_{feedstock_name}_diff_origin',
         'id_checkbox': f'id_{feedstock_name}_checkbox',
     }
+
+
+def _error_entry(feedstock_name, label_prefix, concourse_url, remote_org,
+                 exc):
+    """ entry reporting that the diffs of a feedstock could not be made """
+    feedstock_name = feedstock_name.rstrip('/')
+    message = html.escape('{}: {}'.format(type(exc).__name__, exc))
+    error_html = '<pre class="error">{}</pre>'.format(message)
+    entry = _base_entry(
+        feedstock_name, label_prefix, concourse_url, remote_org)
+    entry.update({
+        'pkg_name': 'error',
+        'version': '',
+        'diff_cf_html': error_html,
+        'diff_origin_html': error_html,
+    })
     return entry
 
 
+def create_report_entries(feedstock_dirs, label_prefix, concourse_url,
+                          base_dir, remote_org, cache_dir=None,
+                          max_workers=None):
+    """ Yield report entries in order, creating them in a process pool.
+
+    A feedstock whose entry cannot be created is reported with an error
+    entry, the remaining feedstocks are still included.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                create_report_entry, feedstock_name, label_prefix,
+                concourse_url, base_dir, remote_org, cache_dir)
+            for feedstock_name in feedstock_dirs]
+        for feedstock_name, future in zip(feedstock_dirs, futures):
+            try:
+                yield future.result()
+            except Exception as exc:
+                logging.warning(
+                    'cannot create report entry: %s: %s', feedstock_name, exc)
+                yield _error_entry(
+                    feedstock_name, label_prefix, concourse_url, remote_org,
+                    exc)
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description='Create a report with recipe diffs for feedstocks')
@@ -75,6 +292,10 @@ def parse_args():
         help='file with feedstock directories to include in report')
     parser.add_argument(
         '--outfile', help='html file to write report to, default is stdout')
+    parser.add_argument(
+        '--outdir',
+        help=('directory to write a paged report to, with an index page and '
+              'diffs loaded when shown, for large numbers of feedstocks'))
     parser.add_argument(
         '--remote-org', default='conda-forge', type=str,
         help='GitHub organization to base diff upon.')
@@ -83,7 +304,8 @@ def parse_args():
         help='feedstock base directory, default is current directory')
     parser.add_argument(
         '--template',
-        help="Report template, default is template included in package.")
+        help=("Report template, default is template included in package. "
+              "With --outdir this is the template of the index page."))
     parser.add_argument(
         '--label-prefix', default='autobot_',
         help="prefix used for pipeline labels.")
@@ -91,6 +313,20 @@ def parse_args():
         '--concourse_url',
         default='https://concourse.example.com/teams/main',
         help="Concourse URL")
+    parser.add_argument(
+        '--cache-dir', default=DEFAULT_CACHE_DIR,
+        help=('directory of cached diffs keyed by commit hashes, default '
+              + DEFAULT_CACHE_DIR))
+    parser.add_argument(
+        '--no-cache', action='store_true', dest='no_cache',
+        help='do not read or write cached diffs')
+    parser.add_argument(
+        '--cache-max-age', default=DEFAULT_CACHE_MAX_AGE, type=float,
+        help=('remove cached diffs not used in this many days, default '
+              + str(DEFAULT_CACHE_MAX_AGE)))
+    parser.add_argument(
+        '--jobs', '-j', default=None, type=int,
+        help='number of worker processes, default is the number of CPUs')
     args = parser.parse_args()
     return args
 
@@ -99,15 +335,19 @@ def main():
     args = parse_args()
     feedstock_dirs = get_feedstock_dirs(args.feedstock_dir, args.file)
 
-    # create report entires
-    report_entries = []
-    for feedstock_name in feedstock_dirs:
-        report_entries.append(create_report_entry(
-            feedstock_name, args.label_prefix, args.concourse_url,
-            args.base_dir, args.remote_org))
-
-    # write report
-    make_report(report_entries, args.template, args.outfile)
+    # create report entries while writing the report
+    cache_dir = None if args.no_cache else args.cache_dir
+    report_entries = create_report_entries(
+        feedstock_dirs, args.label_prefix, args.concourse_url,
+        args.base_dir, args.remote_org, cache_dir, args.jobs)
+    if args.outdir is not None:
+        make_paged_report(
+            report_entries, args.template, args.outdir, args.remote_org)
+    else:
+        make_report(
+            report_entries, args.template, args.outfile, args.remote_org)
+    if cache_dir is not None:
+        prune_fragments(cache_dir, args.cache_max_age * 86400)
     return 0
 
 
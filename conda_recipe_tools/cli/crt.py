@@ -0,0 +1,163 @@
+#! /usr/bin/env python
+# manage the shared object store of a collection of feedstocks and the
+# source cache
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from conda_recipe_tools.git import GitRepo
+from conda_recipe_tools.object_store import (
+    DEFAULT_STORE_PATH, GITHUB_URL_TEMPLATE, LEGACY_STORE_PATH, ObjectStore,
+    bootstrap_feedstock)
+from conda_recipe_tools.source_cache import SOURCE_CACHE_DIR, prune_sources
+from conda_recipe_tools.util import get_feedstock_dirs
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s : %(message)s'
+
+
+def _feedstock_paths(args):
+    feedstock_dirs = get_feedstock_dirs(args.feedstock_dir, args.file)
+    return [os.path.join(args.base_dir, d.rstrip('/')) for d in feedstock_dirs]
+
+
+def _run_all(func, paths, jobs):
+    """ run func for each path in a thread pool, returns number failed """
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [executor.submit(func, path) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                future.result()
+                logging.info('done: ' + path)
+            except subprocess.CalledProcessError as exc:
+                stderr = exc.stderr.decode('utf-8', 'replace').strip()
+                logging.error('failed: %s: %s', path, stderr)
+                failed += 1
+    return failed
+
+
+def bootstrap(args):
+    if args.store == DEFAULT_STORE_PATH and \
+            not os.path.exists(args.store) and \
+            os.path.exists(LEGACY_STORE_PATH):
+        logging.warning(
+            'an object store exists at %s, clones bootstrapped from it still '
+            'borrow its objects.  Move it to %s or pass --store to keep '
+            'using it.', LEGACY_STORE_PATH, DEFAULT_STORE_PATH)
+    store = ObjectStore(args.store).init()
+    orgs = [args.org] + [o for o in args.remote_org if o != args.org]
+
+    def func(path):
+        bootstrap_feedstock(
+            store, path, orgs, args.url_template, args.filter)
+
+    return _run_all(func, _feedstock_paths(args), args.jobs)
+
+
+def gc(args):
+    store = ObjectStore(args.store)
+    logging.info('repacking object store: ' + store.path)
+    store.gc()
+
+    def func(path):
+        repo = GitRepo(path)
+        if os.path.abspath(store.objects_dir) in repo.alternates():
+            repo.repack()
+
+    return _run_all(func, _feedstock_paths(args), args.jobs)
+
+
+def prune(args):
+    max_age = None if args.max_age is None else args.max_age * 86400
+    max_bytes = None if args.max_size is None else args.max_size * 1024 ** 2
+    removed, freed = prune_sources(args.source_cache, max_age, max_bytes)
+    logging.info('removed {} files, {} bytes from: {}'.format(
+        removed, freed, args.source_cache))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Manage the shared git object store for feedstocks')
+    parser.add_argument(
+        '--store', default=DEFAULT_STORE_PATH,
+        help='path to the object store, default ' + DEFAULT_STORE_PATH)
+    parser.add_argument(
+        '--log', default='info',
+        help='log level; debug, info, warning, error, critical')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    def add_feedstock_args(subparser):
+        subparser.add_argument(
+            'feedstock_dir', nargs='*',
+            help='one or more feedstock directories')
+        subparser.add_argument(
+            '--file', '-f', type=str,
+            help='file with feedstock directories')
+        subparser.add_argument(
+            '--base_dir', default='.', type=str,
+            help='feedstock base directory, default is current directory')
+        subparser.add_argument(
+            '--jobs', '-j', default=4, type=int,
+            help='number of feedstocks to process concurrently, default 4')
+
+    bootstrap_parser = subparsers.add_parser(
+        'bootstrap',
+        help=('fetch feedstocks into the object store, clone missing '
+              'feedstocks and make existing ones borrow from the store'))
+    add_feedstock_args(bootstrap_parser)
+    bootstrap_parser.add_argument(
+        '--org', default='AnacondaRecipes',
+        help='organization new feedstocks are cloned from')
+    bootstrap_parser.add_argument(
+        '--remote-org', nargs='*', default=['conda-forge'],
+        help='other organizations fetched into the store, '
+             'default conda-forge')
+    bootstrap_parser.add_argument(
+        '--url-template', default=GITHUB_URL_TEMPLATE,
+        help='template for repository URLs, default ' + GITHUB_URL_TEMPLATE)
+    bootstrap_parser.add_argument(
+        '--filter', default=None,
+        help='partial clone filter for new clones, for example blob:none')
+    bootstrap_parser.set_defaults(func=bootstrap)
+
+    gc_parser = subparsers.add_parser(
+        'gc',
+        help=('repack the object store and remove objects found in the '
+              'store from feedstocks'))
+    add_feedstock_args(gc_parser)
+    gc_parser.set_defaults(func=gc)
+
+    prune_parser = subparsers.add_parser(
+        'prune-sources',
+        help=('remove downloaded source archives from the source cache, '
+              'the recorded hashes are kept'))
+    prune_parser.add_argument(
+        '--source-cache', default=SOURCE_CACHE_DIR,
+        help='path to the source cache, default ' + SOURCE_CACHE_DIR)
+    prune_parser.add_argument(
+        '--max-age', type=float, default=None,
+        help='remove archives not used in this many days')
+    prune_parser.add_argument(
+        '--max-size', type=float, default=None,
+        help=('remove the least recently used archives until the cache is '
+              'at most this many MB'))
+    prune_parser.set_defaults(func=prune)
+    args = parser.parse_args()
+
+    # set up logging
+    log_numeric_level = getattr(logging, args.log.upper(), None)
+    if not isinstance(log_numeric_level, int):
+        raise ValueError('Invalid log level: %s' % args.log)
+    logging.basicConfig(level=log_numeric_level, format=LOG_FORMAT)
+
+    return 1 if args.func(args) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,10 +6,12 @@ import argparse
 import json
 import logging
 import os
+import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from conda_recipe_tools.git import FeedStock, NotFeedstockRepo
-from conda_recipe_tools.util import get_feedstock_dirs
+from conda_recipe_tools.util import get_feedstock_dirs, write_json_atomic
 
 LOG_FORMAT = '%(asctime)s - %(levelname)s : %(message)s'
 
@@ -23,25 +25,71 @@ def read_last_commits(checkfile):
     return last_commits
 
 
-def find_changed_feedstocks(feedstock_dirs, last_commits, remote_org):
-    """ Return a list of feedstocks which have changed. """
-    changed_feedstocks = []
-    for feedstock_dir in feedstock_dirs:
-        logging.info('checking: ' + feedstock_dir)
-        if feedstock_dir.endswith('/'):
-            feedstock_dir = feedstock_dir[:-1]
-        try:
-            feedstock = FeedStock(feedstock_dir)
-        except NotFeedstockRepo:
-            logging.warning('not a feedstock: ' + feedstock_dir)
-            continue
+def remote_master(feedstock, remote_org, ls_remote=False, last_commit=None):
+    """
+    Commit hash of master in the remote_org feedstock repository.
+
+    When ls_remote is True the remote head is first queried with
+    git ls-remote and the feedstock is only fetched when the head differs
+    from last_commit or from the local remote tracking branch.
+    """
+    try:
+        feedstock.config_get(f'remote.{remote_org}.url')
+    except subprocess.CalledProcessError:
         feedstock.add_remote(remote_org, check=False)
-        feedstock.fetch(remote_org)
-        commit_hash = feedstock.rev_parse(f'{remote_org}/master')
-        if last_commits.get(feedstock_dir) != commit_hash:
-            logging.info('feedstock has changed: ' + feedstock_dir)
-            changed_feedstocks.append(feedstock_dir)
-            last_commits[feedstock_dir] = commit_hash
+    ref = f'{remote_org}/master'
+    if ls_remote:
+        heads = feedstock.ls_remote(remote_org, ['refs/heads/master'])
+        head = heads.get('refs/heads/master')
+        try:
+            local_head = feedstock.rev_parse(ref)
+        except subprocess.CalledProcessError:
+            local_head = None
+        if head is not None and head == last_commit == local_head:
+            return head
+    feedstock.fetch(remote_org)
+    return feedstock.rev_parse(ref)
+
+
+def _check_feedstock(feedstock_dir, remote_org, ls_remote, last_commit):
+    try:
+        feedstock = FeedStock(feedstock_dir)
+    except NotFeedstockRepo:
+        logging.warning('not a feedstock: ' + feedstock_dir)
+        return None
+    try:
+        return remote_master(feedstock, remote_org, ls_remote, last_commit)
+    except subprocess.CalledProcessError as exc:
+        stderr = exc.stderr.decode('utf-8', 'replace').strip()
+        logging.warning('could not check %s: %s', feedstock_dir, stderr)
+        return None
+
+
+def find_changed_feedstocks(feedstock_dirs, last_commits, remote_org,
+                            ls_remote=False, max_workers=1):
+    """ Return a list of feedstocks which have changed.
+
+    last_commits is updated with the new commit hash of changed feedstocks.
+    Feedstocks are checked concurrently in max_workers threads.  When
+    ls_remote is True only feedstocks whose head moved are fetched.
+    """
+    feedstock_dirs = [d[:-1] if d.endswith('/') else d for d in feedstock_dirs]
+    changed_feedstocks = []
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = [
+            executor.submit(
+                _check_feedstock, feedstock_dir, remote_org, ls_remote,
+                last_commits.get(feedstock_dir))
+            for feedstock_dir in feedstock_dirs]
+        for feedstock_dir, future in zip(feedstock_dirs, futures):
+            logging.info('checking: ' + feedstock_dir)
+            commit_hash = future.result()
+            if commit_hash is None:
+                continue
+            if last_commits.get(feedstock_dir) != commit_hash:
+                logging.info('feedstock has changed: ' + feedstock_dir)
+                changed_feedstocks.append(feedstock_dir)
+                last_commits[feedstock_dir] = commit_hash
     return changed_feedstocks
 
 
@@ -63,6 +111,13 @@ def main():
     parser.add_argument(
         '--remote-org', default='conda-forge', type=str,
         help='GitHub organization to check for updates.')
+    parser.add_argument(
+        '--ls-remote', action='store_true',
+        help=('query remote heads with git ls-remote and only fetch '
+              'feedstocks whose head moved'))
+    parser.add_argument(
+        '--jobs', '-j', default=1, type=int,
+        help='number of feedstocks to check concurrently, default 1')
     parser.add_argument(
         '--base_dir', default='.', type=str,
         help='feedstock base directory, default is current directory')
@@ -81,11 +136,11 @@ def main():
     feedstock_dirs = get_feedstock_dirs(args.feedstock_dir, args.file)
     last_commits = read_last_commits(args.checkfile)
     changed_feedstocks = find_changed_feedstocks(
-        feedstock_dirs, last_commits, args.remote_org)
+        feedstock_dirs, last_commits, args.remote_org, args.ls_remote,
+        args.jobs)
 
     # write checkfile and outfile
-    with open(args.checkfile, 'w') as f:
-        json.dump(last_commits, f)
+    write_json_atomic(last_commits, args.checkfile)
     with open(args.outfile, 'wt') as f:
         for changed_feedstock in changed_feedstocks:
             f.write(changed_feedstock+'\n')
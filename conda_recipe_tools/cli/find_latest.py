@@ -1,9 +1,17 @@
 #! /usr/bin/env python
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from conda_recipe_tools.find_version import find_latest_version
+from conda_recipe_tools.find_version import (
+    DEFAULT_TIMEOUT, DeadlineExceeded, HostUnavailable, LookupBudget)
 from conda_recipe_tools.pkg_info import read_pkg_info
+from conda_recipe_tools.version_store import (
+    DEFAULT_STORE_PATH, is_stale, lookup_entry, read_store, write_store)
+
+LOOKUP_FAILED = 'version_lookup_failed'
+DEADLINE_EXCEEDED = 'deadline_exceeded'
+HOST_UNAVAILABLE = 'host_unavailable'
 
 
 def parse_arguments():
@@ -23,6 +31,39 @@ def parse_arguments():
             "--fail-hard", action="store_true",
             help="If the lookup fails, this will cause the tool to exit early."
             )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=8,
+        help=("Number of lookups to perform concurrently, default is 8. "
+              "Each version source also limits its own concurrency."))
+    parser.add_argument(
+        "--timeout", type=float, default=DEFAULT_TIMEOUT,
+        help=("Timeout in seconds for each request to an upstream server, "
+              "default is %(default)s."))
+    parser.add_argument(
+        "--deadline", type=float, default=None,
+        help=("Maximum time in seconds for the entire run. Packages which "
+              "are not checked by this time are reported as "
+              f"{DEADLINE_EXCEEDED}. Default is no deadline."))
+    parser.add_argument(
+        "--max-host-failures", type=int, default=3,
+        help=("Number of consecutive failures after which a host is skipped, "
+              f"skipped packages are reported as {HOST_UNAVAILABLE}. "
+              "Default is %(default)s."))
+    parser.add_argument(
+        "--store", action='store', default=DEFAULT_STORE_PATH,
+        help=("File in which lookup results are kept between runs, "
+              "default is %(default)s."))
+    parser.add_argument(
+        "--no-store", action='store_true',
+        help="Do not read or update the results store.")
+    parser.add_argument(
+        "--max-age", type=float, default=None,
+        help=("Re-query packages whose stored result is older than this many "
+              "seconds. The default uses the cache lifetime of each version "
+              "source, 12 hours unless the source sets its own."))
+    parser.add_argument(
+        "--force", action='store_true',
+        help="Re-query all packages regardless of the age of stored results.")
     parser.add_argument(
         'packages', nargs='*',
         help='packages to check, leave blank to check all packages')
@@ -41,17 +82,51 @@ def main():
         names_to_check = sorted(pkg_info.keys())
     if not args.no_header:
         print('package_name,latest_version')
-    for name in names_to_check:
+    budget = LookupBudget(
+        args.timeout, args.deadline, args.max_host_failures)
+    store = {} if args.no_store else read_store(args.store)
+
+    def lookup(name):
+        """ Return a tuple of the latest version and a new store entry. """
         info = pkg_info.get(name, {})
         update_type = info.get('update_type', 'pypi')
         extra = info.get('update_extra', {})
+        entry = store.get(name)
+        if not args.force and not is_stale(
+                entry, name, update_type, args.max_age):
+            return entry['latest_version'], None
         try:
-            latest_version = find_latest_version(name, update_type, extra)
-        except:
-            latest_version = 'version_lookup_failed'
-            if args.fail_hard:
-                exit(1)
+            new_entry = lookup_entry(name, update_type, extra, entry, budget)
+        except DeadlineExceeded:
+            return DEADLINE_EXCEEDED, None
+        except HostUnavailable:
+            return HOST_UNAVAILABLE, None
+        except Exception:
+            return LOOKUP_FAILED, None
+        return new_entry['latest_version'], new_entry
+
+    # results are printed in the order the packages were given
+    failed_hard = False
+    executor = ThreadPoolExecutor(max_workers=args.jobs)
+    futures = [executor.submit(lookup, name) for name in names_to_check]
+    for name, future in zip(names_to_check, futures):
+        latest_version, new_entry = future.result()
+        if new_entry is not None and new_entry['latest_version'] is not None:
+            store[name] = new_entry
+        if latest_version == LOOKUP_FAILED and args.fail_hard:
+            failed_hard = True
+            break
         print(f'{name},{latest_version}')
+    if failed_hard:
+        # do not wait for the remaining lookups, only those already
+        # running are completed
+        for future in futures:
+            future.cancel()
+    executor.shutdown(wait=not failed_hard)
+    if not args.no_store:
+        write_store(store, args.store)
+    if failed_hard:
+        exit(1)
 
 
 if __name__ == "__main__":
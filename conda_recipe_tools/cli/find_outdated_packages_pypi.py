@@ -3,36 +3,58 @@
 
 import argparse
 import json
-import xmlrpc.client as xmlrpclib
+from concurrent.futures import ThreadPoolExecutor
 
-import conda.api as api
+import requests
+
+from conda_recipe_tools.pypi_metadata import PYPI_CACHE
+from conda_recipe_tools.repodata import newest_version_for_channel
 
 try:
-    from packaging.version import parse as parse_version
+    from packaging.version import InvalidVersion, parse as parse_version
 except ImportError:
+    from pip._vendor.packaging.version import InvalidVersion
     from pip._vendor.packaging.version import parse as parse_version
 
 
-def find_latest_pypi_version(client, package_name):
+def find_latest_pypi_version(package_name):
     """
     Return the latest non-prerelease from PyPI.
 
     None is returned if there are no releases or the package does not exist on
     PyPI.
     """
-    all_releases = client.package_releases(package_name, True)
-    versions = [parse_version(s) for s in all_releases]
+    versions = []
+    for ver_str in PYPI_CACHE.releases(package_name):
+        try:
+            versions.append(parse_version(ver_str))
+        except InvalidVersion:
+            continue
     filtered = [v for v in versions if not v.is_prerelease]
     if len(filtered) == 0:
         return None
     return max(filtered)
 
 
-def find_latest_conda_version(index, package_name):
-    """ Return the latest version of a package from a conda channel index. """
-    valid = [v for v in index.values() if v['name'] == package_name]
-    versions = [parse_version(v['version']) for v in valid]
-    return max(versions)
+def find_latest_pypi_versions(package_names, max_workers=16):
+    """
+    Return the latest non-prerelease from PyPI for a number of packages.
+
+    Lookups are made concurrently using at most max_workers threads.  The
+    returned dictionary maps package names to the latest version, None when
+    the package does not exist on PyPI, has no non-prerelease versions or the
+    lookup failed.
+    """
+    def lookup(package_name):
+        try:
+            return find_latest_pypi_version(package_name)
+        except (requests.RequestException, ValueError):
+            return None
+
+    package_names = list(package_names)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        versions = executor.map(lookup, package_names)
+        return dict(zip(package_names, versions))
 
 
 def parse_arguments():
@@ -52,19 +74,31 @@ def parse_arguments():
     parser.add_argument(
         '--channel', '-c', action='store', default='conda-forge',
         help='Conda channel to check.  Default is conda-forge')
+    parser.add_argument(
+        '--subdirs', nargs='*', default=None,
+        help=('subdirs of the channel to examine, default is linux-64, '
+              'osx-64, win-32, win-64, linux-ppc64le and noarch.'))
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=16,
+        help='Number of concurrent PyPI lookups, default is 16.')
     parser.add_argument(
         '--json', action='store', help='Save outdated packages to json file.')
     return parser.parse_args()
 
 
-def find_outdated_packages(index, package_names, verbose):
-    """ Return a list of out-of-date packages. """
-    client = xmlrpclib.ServerProxy('https://pypi.python.org/pypi')
+def find_outdated_packages(newest, package_names, verbose, max_workers=16):
+    """ Return a list of out-of-date packages.
+
+    newest is a dictionary mapping conda package names to the newest version
+    in the channel.
+    """
+    package_names = sorted(p for p in package_names if p in newest)
+    pypi_versions = find_latest_pypi_versions(package_names, max_workers)
 
     outdated_packages = []
-    for package_name in sorted(package_names):
-        pypi_latest_version = find_latest_pypi_version(client, package_name)
-        conda_latest_version = find_latest_conda_version(index, package_name)
+    for package_name in package_names:
+        pypi_latest_version = pypi_versions[package_name]
+        conda_latest_version = newest[package_name]
 
         if pypi_latest_version is None:
             if verbose:
@@ -90,11 +124,14 @@ def main():
     args = parse_arguments()
 
     # determine package names to check
-    index = api.get_index(
-        channel_urls=[args.channel], prepend=False, use_cache=False)
+    newest, _ = newest_version_for_channel(args.channel, args.subdirs)
     package_names = set(args.packages)
     if len(package_names) == 0:  # no package names given on command line
-        package_names = {v['name'] for k, v in index.items()}
+        package_names = set(newest)
+    missing = package_names.difference(newest)
+    if missing and args.verb:
+        for package_name in sorted(missing):
+            print(package_name, "not found in channel", args.channel)
 
     # remove skipped packages
     if args.skip is not None:
@@ -102,7 +139,8 @@ def main():
             pkgs_to_skip = [line.strip() for line in f]
         package_names = [p for p in package_names if p not in pkgs_to_skip]
 
-    outdated_packages = find_outdated_packages(index, package_names, args.verb)
+    outdated_packages = find_outdated_packages(
+        newest, package_names, args.verb, args.jobs)
 
     # save outdated_packages to json formatted file is specified
     if args.json is not None:
@@ -5,55 +5,143 @@
 import argparse
 import logging
 import os
+import subprocess
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from conda_recipe_tools.git import FeedStock, NotFeedstockRepo
 from conda_recipe_tools.recipe import CondaRecipe
-from conda_recipe_tools.util import get_feedstock_dirs
+from conda_recipe_tools.util import get_feedstock_dirs, write_json_atomic
 
 
 LOG_FORMAT = '%(asctime)s - %(levelname)s : %(message)s'
 
+PUSHED = 'pushed'
+FORCE_PUSHED = 'force_pushed'
+FAILED = 'failed'
+# push is rejected and needs the archive and force push fallback
+REJECTED = 'rejected'
 
-def push_feedstock(feedstock_path):
-    """ Push git changes to a feedstock to AnacondaRecipes
 
-    returns True on success, False when the push failed
+def _result(feedstock_path, status, message='', archive_branch=None):
+    return {
+        'feedstock': feedstock_path,
+        'status': status,
+        'archive_branch': archive_branch,
+        'message': message,
+    }
+
+
+def _stderr(complete):
+    return complete.stderr.decode('utf-8', 'replace').strip()
+
+
+def plain_push(feedstock_path):
+    """ Push master to origin/master if it is a fast-forward.
+
+    Returns a result dictionary whose status is PUSHED, FAILED or REJECTED
+    when the push is not a fast-forward.
     """
     try:
         feedstock = FeedStock(feedstock_path)
     except NotFeedstockRepo:
-        logging.warn("push failed because repo is not a feedstock")
-        return False
-
+        return _result(feedstock_path, FAILED, 'not a feedstock')
+    except subprocess.CalledProcessError as exc:
+        return _result(feedstock_path, FAILED, _stderr(exc) or str(exc))
     complete = feedstock.push(check=False)
-    if complete.returncode:     # push failed b/c it is not a fast-forward
-        logging.info('standard push failed, creating archive branch')
+    if complete.returncode == 0:
+        return _result(feedstock_path, PUSHED)
+    stderr = _stderr(complete)
+    if '[rejected]' in stderr:
+        return _result(feedstock_path, REJECTED, stderr)
+    return _result(feedstock_path, FAILED, stderr)
 
-        # create temp branch of origin/master
-        temp_branch = 'temp_origin_master'
-        feedstock.branch(temp_branch)   # git checkout -b temp_origin_master
-        feedstock.fetch()               # git fetch origin
-        feedstock.reset_hard()          # git reset --hard origin/master
 
-        # find the recipe version
-        meta_filename = os.path.join(feedstock_path, 'recipe', 'meta.yaml')
-        recipe = CondaRecipe(meta_filename)
-        version = recipe.version
+def archive_push(feedstock_path):
+    """ Archive origin/master to a branch then force push master.
+
+    origin/master is pushed to an archive_<version> branch, where version is
+    read from the recipe at origin/master, before master is force pushed.
+    The working tree is not modified.
+    """
+    feedstock = FeedStock(feedstock_path)
+    try:
+        feedstock.fetch()               # git fetch origin
+        # find the recipe version of origin/master
+        text = feedstock.meta_yaml('origin/master')
+        if text is None:
+            return _result(
+                feedstock_path, FAILED, 'no recipe/meta.yaml in origin/master')
+        version = CondaRecipe.from_text(text).version
 
         # push to archive branch
         archive_branch = 'archive_{version}'.format(version=version)
         logging.info('push origin/master to ' + archive_branch)
-        # git push origin master:archive_version
-        feedstock.push(remote_branch=archive_branch, local_branch='HEAD')
+        # git push origin refs/remotes/origin/master:archive_version
+        feedstock.push(
+            local_branch='refs/remotes/origin/master',
+            remote_branch='refs/heads/' + archive_branch)
 
         # force push master branch
-        feedstock.checkout()        # git checkout master
         feedstock.push(force=True)  # git push --force origin master:master
-        # git branch -D temp_origin_master
-        feedstock.branch_delete(temp_branch)
-        logging.info('force push succeeded')
-    return True
+    except subprocess.CalledProcessError as exc:
+        return _result(feedstock_path, FAILED, _stderr(exc) or str(exc))
+    finally:
+        feedstock.close()
+    return _result(feedstock_path, FORCE_PUSHED, archive_branch=archive_branch)
+
+
+def push_feedstock(feedstock_path):
+    """ Push git changes to a feedstock to AnacondaRecipes
+
+    returns a result dictionary with feedstock, status, archive_branch and
+    message keys, status is PUSHED, FORCE_PUSHED or FAILED.
+    """
+    result = plain_push(feedstock_path)
+    if result['status'] == REJECTED:
+        logging.info('standard push failed, creating archive branch')
+        result = archive_push(feedstock_path)
+    return result
+
+
+def push_feedstocks(feedstock_paths, max_workers=4):
+    """ Push git changes to many feedstocks.
+
+    Plain pushes run concurrently in max_workers threads.  Feedstocks whose
+    push is rejected are queued for the archive and force push fallback,
+    which run one at a time.  Results are returned, and logged, in the order
+    of feedstock_paths.  Any exception raised while pushing a feedstock is
+    recorded as a FAILED result rather than stopping the other pushes.
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor, \
+            ThreadPoolExecutor(max_workers=1) as fallback_executor:
+
+        def push(feedstock_path):
+            result = plain_push(feedstock_path)
+            if result['status'] == REJECTED:
+                return fallback_executor.submit(archive_push, feedstock_path)
+            return result
+
+        futures = [executor.submit(push, path) for path in feedstock_paths]
+        for feedstock_path, future in zip(feedstock_paths, futures):
+            try:
+                result = future.result()
+                if isinstance(result, Future):
+                    logging.info('queued archive and force push: ' +
+                                 feedstock_path)
+                    result = result.result()
+            except Exception as exc:
+                # record unexpected errors, e.g. OSError, and carry on
+                result = _result(feedstock_path, FAILED, '{}: {}'.format(
+                    type(exc).__name__, exc))
+            if result['status'] == FAILED:
+                logging.warning(
+                    'push failed: %s: %s', feedstock_path, result['message'])
+            else:
+                logging.info('%s: %s', result['status'], feedstock_path)
+            results.append(result)
+    return results
 
 
 def main():
@@ -68,6 +156,12 @@ def main():
     parser.add_argument(
         '--base_dir', default='.', type=str,
         help='feedstock base directory, default is current directory')
+    parser.add_argument(
+        '--jobs', '-j', default=4, type=int,
+        help='number of plain pushes to run concurrently, default 4')
+    parser.add_argument(
+        '--report',
+        help='JSON file to write the outcome of each push to')
     parser.add_argument(
         '--log', default='info',
         help='log level; debug, info, warning, error, critical')
@@ -79,15 +173,14 @@ def main():
         raise ValueError('Invalid log level: %s' % args.log)
     logging.basicConfig(level=log_numeric_level, format=LOG_FORMAT)
 
-    # sync recipes
+    # push feedstocks
     feedstock_dirs = get_feedstock_dirs(args.feedstock_dir, args.file)
-    for feedstock_dir in feedstock_dirs:
-        if feedstock_dir.endswith('/'):
-            feedstock_dir = feedstock_dir[:-1]
-        logging.info('pushing: ' + feedstock_dir)
-        feedstock_path = os.path.join(args.base_dir, feedstock_dir)
-        if not push_feedstock(feedstock_path):
-            logging.warning('push failed: ' + feedstock_dir)
+    feedstock_paths = [
+        os.path.join(args.base_dir, d[:-1] if d.endswith('/') else d)
+        for d in feedstock_dirs]
+    results = push_feedstocks(feedstock_paths, args.jobs)
+    if args.report:
+        write_json_atomic(results, args.report, indent=1)
     return 0
 
 
@@ -2,11 +2,99 @@
 # print out requirements for a PyPI package
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+from conda_recipe_tools.pypi_metadata import PYPI_CACHE, normalize_name
+from conda_recipe_tools.repodata import newest_version_for_channel
 
-REQ_NO_VERSION = 'https://pypi.org/pypi/{package}/json'
-REQ_WITH_VERSION = 'https://pypi.org/pypi/{package}/{version}/json'
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+except ImportError:
+    from pip._vendor.packaging.requirements import InvalidRequirement
+    from pip._vendor.packaging.requirements import Requirement
+
+
+def requirement_names(requires_dist):
+    """ Return the normalized names of the requirements which apply.
+
+    Requirements only needed for extras or whose environment marker does not
+    match the current environment are skipped.
+    """
+    names = []
+    for req_str in requires_dist or []:
+        try:
+            req = Requirement(req_str)
+        except InvalidRequirement:
+            continue
+        if req.marker is not None and not req.marker.evaluate({'extra': ''}):
+            continue
+        names.append(normalize_name(req.name))
+    return names
+
+
+def resolve_dependencies(packages, max_workers=8):
+    """
+    Find the transitive PyPI dependencies of a number of packages.
+
+    Each level of the dependency tree is looked up concurrently, packages
+    are only looked up once.
+
+    Parameters
+    ----------
+    packages : list of str
+        Names of the packages, use package::version for a specific version.
+    max_workers : int
+        Maximum number of concurrent lookups.
+
+    Returns
+    -------
+    dependencies : dict
+        Dictionary mapping the normalized name of every package in the tree
+        to a list of the names of its direct requirements, None for packages
+        which are not on PyPI.
+
+    """
+    dependencies = {}
+    to_visit = []
+    for package in packages:
+        version = None
+        if '::' in package:
+            package, version = package.split('::')
+        to_visit.append((normalize_name(package), version))
+
+    def lookup(item):
+        name, version = item
+        requires_dist = PYPI_CACHE.requires_dist(name, version)
+        if requires_dist is None:
+            return None
+        return requirement_names(requires_dist)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while to_visit:
+            level = [i for i in dict.fromkeys(to_visit)
+                     if i[0] not in dependencies]
+            to_visit = []
+            for (name, _), reqs in zip(level, executor.map(lookup, level)):
+                dependencies[name] = reqs
+                to_visit.extend(
+                    (r, None) for r in reqs or [] if r not in dependencies)
+    return dependencies
+
+
+def print_direct(packages):
+    """ Print the direct requirements of packages. """
+    for package in packages:
+        print(package)
+        if '::' in package:
+            package, version = package.split('::')
+        else:
+            version = None
+
+        requires_dist = PYPI_CACHE.requires_dist(package, version)
+        print("-----------------------")
+        for req in requires_dist or []:
+            print(req)
+        print()
 
 
 def main():
@@ -15,22 +103,44 @@ def main():
     parser.add_argument(
         'packages', type=str, nargs='+',
         help='packages to open pages for, use package::version for versions')
+    parser.add_argument(
+        '--recursive', '-r', action='store_true',
+        help='list all transitive requirements rather than direct ones')
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=8,
+        help='number of concurrent PyPI lookups in recursive mode')
+    parser.add_argument(
+        '--channel', '-c', type=str, default=None,
+        help=('in recursive mode, show the newest version of each '
+              'requirement in this conda channel'))
+    parser.add_argument(
+        '--subdirs', nargs='*', default=None,
+        help=('subdirs of the channel to examine, default is linux-64, '
+              'osx-64, win-32, win-64, linux-ppc64le and noarch.'))
+    parser.add_argument(
+        '--missing-only', action='store_true',
+        help='with --channel, only list requirements missing from the channel')
     args = parser.parse_args()
 
-    for package in args.packages:
-        print(package)
-        if '::' in package:
-            package, version = package.split('::')
-            url = REQ_WITH_VERSION.format(package=package, version=version)
+    if not args.recursive:
+        print_direct(args.packages)
+        return
+
+    dependencies = resolve_dependencies(args.packages, args.jobs)
+    if args.channel is None:
+        for name in sorted(dependencies):
+            print(name)
+        return
+    newest, _ = newest_version_for_channel(args.channel, args.subdirs)
+    newest = {normalize_name(k): v for k, v in newest.items()}
+    print('package_name,channel_version')
+    for name in sorted(dependencies):
+        if name in newest:
+            if not args.missing_only:
+                print(f'{name},{newest[name]}')
         else:
-            url = REQ_NO_VERSION.format(package=package)
+            print(f'{name},missing')
 
-        resp = requests.get(url)
-        out = resp.json()
-        print("-----------------------")
-        for req in out['info']['requires_dist']:
-            print(req)
-        print()
 
 if __name__ == "__main__":
     main()
@@ -2,10 +2,10 @@
 import argparse
 import csv
 import datetime
-import os.path
+import logging
 import subprocess
 
-from conda_recipe_tools.recipe import CondaRecipe
+from conda_recipe_tools.batch_update import update_recipes, write_results
 
 
 PACKAGES_TO_SKIP = [
@@ -13,6 +13,7 @@ PACKAGES_TO_SKIP = [
     'botocore',
 ]
 MAX_BUILDS = '8'
+LOG_FORMAT = '%(asctime)s - %(levelname)s : %(message)s'
 
 
 def srun(cmd, check=False):
@@ -45,38 +46,44 @@ def parse_arguments():
     parser.add_argument(
         '--dry-run', action='store_true',
         help='Prepare for batch builds but do not submit')
+    parser.add_argument(
+        '--log', default='info',
+        help='log level; debug, info, warning, error, critical')
     return parser.parse_args()
 
 
 def main():
     args = parse_arguments()
-    to_process = get_packages_to_process(args.csv)
 
-    # update recipes, record those which were successful
-    good_feedstocks = []
-    for name, version in to_process.items():
+    # set up logging
+    log_numeric_level = getattr(logging, args.log.upper(), None)
+    if not isinstance(log_numeric_level, int):
+        raise ValueError('Invalid log level: %s' % args.log)
+    logging.basicConfig(level=log_numeric_level, format=LOG_FORMAT)
 
-        feedstock_name = "{}-feedstock".format(name)
-        meta_yaml = os.path.join(feedstock_name, 'recipe', 'meta.yaml')
+    to_process = get_packages_to_process(args.csv)
 
-        # update the recipes
-        srun("sync_cf {}".format(feedstock_name))
-        srun("update_recipe --version {} --meta {}".format(version, meta_yaml))
+    dt = datetime.datetime.now()
 
-        # check if the update was successful
-        try:
-            recipe = CondaRecipe(meta_yaml)
-            if recipe.version == version:
-                good_feedstocks.append(feedstock_name)
-        except:
-            continue
+    # sync and update the recipes, record those which were successful
+    rows = [
+        {'feedstock': "{}-feedstock".format(name), 'version': version,
+         'hash': None}
+        for name, version in to_process.items()]
+    if rows:
+        srun("sync_cf " + " ".join(row['feedstock'] for row in rows))
+    results = update_recipes(rows)
+    write_results(
+        results, dt.strftime('grimlock_update_results_%Y%m%d.json'))
+    good_feedstocks = [
+        r['feedstock'] for r in results
+        if r['status'] in ('updated', 'unchanged')]
 
     # create recipe_clobber.yaml files
     for feedstock_name in good_feedstocks:
         srun("create_clobber {}".format(feedstock_name))
 
     # create grimlock_batch_file_20YYMMDD.txt
-    dt = datetime.datetime.now()
     batch_file_name = dt.strftime('grimlock_batch_file_%Y%m%d.txt')
     label_prefix = dt.strftime('grimlock_%Y%m%d_')
     with open(batch_file_name, 'w') as f:
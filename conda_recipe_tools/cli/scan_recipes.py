@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+# scan recipes in a collection of feedstocks and index their metadata
+
+import argparse
+import json
+import sys
+
+from conda_recipe_tools.recipe_index import (
+    DEFAULT_INDEX_PATH, RECIPE_PATTERN, find_recipe_paths, read_index,
+    scan_recipes, write_index)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Scan feedstock recipes and index their metadata')
+    parser.add_argument(
+        '--base_dir', default='.', type=str,
+        help='feedstock base directory, default is current directory')
+    parser.add_argument(
+        '--pattern', default=RECIPE_PATTERN, type=str,
+        help='glob pattern for recipes relative to base_dir, default is '
+             '%(default)s')
+    parser.add_argument(
+        '--index', default=DEFAULT_INDEX_PATH, type=str,
+        help='index file used to skip unchanged recipes, default is '
+             '%(default)s')
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=None,
+        help='number of processes used to parse recipes, default is the '
+             'number of processors')
+    parser.add_argument(
+        '--outfile', type=str,
+        help='write the metadata of the scanned recipes to this JSON file, '
+             'default is to print a CSV summary')
+    parser.add_argument(
+        "--no_header", action='store_true',
+        help='Do not print header line, helpful when appending to a file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    index = read_index(args.index)
+    paths = find_recipe_paths(args.base_dir, args.pattern)
+    metadata = scan_recipes(paths, index, args.jobs)
+    write_index(index, args.index)
+
+    if args.outfile:
+        with open(args.outfile, 'w') as f:
+            json.dump(metadata, f, indent=1, sort_keys=True)
+        return 0
+    if not args.no_header:
+        print('path,name,version,build_number')
+    for path in paths:
+        info = metadata[path]
+        if 'error' in info:
+            print(f'{path},scan_failed,,')
+            continue
+        print(f"{path},{info['name']},{info['version']},"
+              f"{info['build_number']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,24 +6,24 @@ import argparse
 import logging
 import os
 import pathlib
+import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from conda_recipe_tools.git import FeedStock, NotFeedstockRepo
-from conda_recipe_tools.util import get_feedstock_dirs
+from conda_recipe_tools.util import get_feedstock_dirs, write_json_atomic
 
 LOG_FORMAT = '%(asctime)s - %(levelname)s : %(message)s'
 
+SUCCEEDED = 'succeeded'
+CONFLICTED = 'conflicted'
+ERRORED = 'errored'
+TIMEOUT = 'timeout'
+STATUSES = (SUCCEEDED, CONFLICTED, ERRORED, TIMEOUT)
 
-def sync_feedstock(feedstock_path):
-    """ Sync a feedstock against conda-forge by a rebase
 
-    returns True on success, False when the rebase failed
-    """
-    try:
-        feedstock = FeedStock(feedstock_path)
-    except NotFeedstockRepo:
-        logging.warning('not a feedstock: ' + feedstock_path)
-        return False
+def _sync(feedstock):
     feedstock.rebase_abort(check=False)  # abort any failed rebases
     feedstock.checkout()    # git checkout master
     feedstock.fetch()       # git fetch origin
@@ -34,8 +34,53 @@ def sync_feedstock(feedstock_path):
     if complete.returncode:
         # the rebase failed, abort it
         feedstock.rebase_abort(check=False)
-        return False
-    return True
+        return CONFLICTED
+    return SUCCEEDED
+
+
+def sync_feedstock(feedstock_path, timeout=None):
+    """ Sync a feedstock against conda-forge by a rebase
+
+    Parameters
+    ----------
+    feedstock_path : str
+        Path to the feedstock.
+    timeout : float or None
+        Seconds allowed for all git commands run on the feedstock, None for
+        no limit.
+
+    Returns
+    -------
+    status : str
+        SUCCEEDED, CONFLICTED when the rebase failed, TIMEOUT when the
+        timeout expired or ERRORED for any other failure.
+    message : str
+        Description of the failure, empty on success.
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+    try:
+        feedstock = FeedStock(feedstock_path, deadline=deadline)
+    except NotFeedstockRepo:
+        return ERRORED, 'not a feedstock'
+    except subprocess.TimeoutExpired:
+        return TIMEOUT, 'timed out after {} seconds'.format(timeout)
+    except (subprocess.CalledProcessError, OSError) as exc:
+        return ERRORED, str(exc)
+    try:
+        status = _sync(feedstock)
+    except subprocess.TimeoutExpired:
+        # clean up any partial rebase without a time limit
+        feedstock.deadline = None
+        feedstock.rebase_abort(check=False)
+        return TIMEOUT, 'timed out after {} seconds'.format(timeout)
+    except subprocess.CalledProcessError as exc:
+        stderr = exc.stderr.decode('utf-8', 'replace').strip()
+        return ERRORED, '{}: {}'.format(' '.join(exc.cmd[3:]), stderr)
+    if status == CONFLICTED:
+        return status, 'rebase failed'
+    return status, ''
 
 
 def main():
@@ -53,6 +98,16 @@ def main():
     parser.add_argument(
         '--base_dir', default='.', type=str,
         help='feedstock base directory, default is current directory')
+    parser.add_argument(
+        '--jobs', '-j', default=1, type=int,
+        help='number of feedstocks to sync concurrently, default 1')
+    parser.add_argument(
+        '--timeout', type=float, default=None,
+        help='seconds allowed to sync each feedstock, default is no limit')
+    parser.add_argument(
+        '--summary',
+        help=('JSON file to write the feedstocks which succeeded, '
+              'conflicted, errored or timed out, default is not to write'))
     parser.add_argument(
         '--log', default='info',
         help='log level; debug, info, warning, error, critical')
@@ -66,16 +121,30 @@ def main():
 
     # sync recipes
     feedstock_dirs = get_feedstock_dirs(args.feedstock_dir, args.file)
+    feedstock_dirs = [d[:-1] if d.endswith('/') else d for d in feedstock_dirs]
     successfully_rebased = []
-    for feedstock_dir in feedstock_dirs:
-        if feedstock_dir.endswith('/'):
-            feedstock_dir = feedstock_dir[:-1]
-        logging.info('rebasing: ' + feedstock_dir)
-        feedstock_path = os.path.join(args.base_dir, feedstock_dir)
-        if sync_feedstock(feedstock_path):
-            successfully_rebased.append(feedstock_path)
-        else:
-            logging.warning('rebase failed: ' + feedstock_dir)
+    summary = {status: [] for status in STATUSES}
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+        futures = [
+            executor.submit(
+                sync_feedstock, os.path.join(args.base_dir, d), args.timeout)
+            for d in feedstock_dirs]
+        # report results in the order given, as each one completes
+        for feedstock_dir, future in zip(feedstock_dirs, futures):
+            status, message = future.result()
+            summary[status].append(feedstock_dir)
+            if status == SUCCEEDED:
+                logging.info('rebased: ' + feedstock_dir)
+                successfully_rebased.append(
+                    os.path.join(args.base_dir, feedstock_dir))
+            else:
+                logging.warning(
+                    'rebase %s: %s: %s', status, feedstock_dir, message)
+    logging.info(', '.join(
+        '{} {}'.format(len(summary[s]), s) for s in STATUSES))
+
+    if args.summary:
+        write_json_atomic(summary, args.summary, indent=1)
 
     # write file of successfully rebased feedstocks if requested
     if args.outfile:
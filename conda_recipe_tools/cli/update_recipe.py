@@ -1,10 +1,14 @@
 #! /usr/bin/env python
 
 import argparse
+import logging
 
+from conda_recipe_tools.batch_update import (
+    read_batch_csv, update_recipes, write_results)
+from conda_recipe_tools.pypi_metadata import PYPI_CACHE
 from conda_recipe_tools.recipe import CondaRecipe, find_hash
 
-import requests
+LOG_FORMAT = '%(asctime)s - %(levelname)s : %(message)s'
 
 
 # This function is of limited use, it only looks up version for PyPI packages,
@@ -18,10 +22,7 @@ def find_latest_version(recipe):
 
 
 def _find_latest_version_pypi(project):
-    url = 'https://pypi.org/pypi/{}/json'.format(project)
-    r = requests.get(url)
-    payload = r.json()
-    return payload['info']['version']
+    return PYPI_CACHE.latest_version(project)
 
 
 def parse_arguments():
@@ -39,12 +40,55 @@ def parse_arguments():
     parser.add_argument(
         '--build_number', action='store', default='0',
         help="build_number for recipe.")
+    parser.add_argument(
+        '--no-source-cache', action='store_true',
+        help="do not use or populate the local source cache when "
+             "determining the hash.")
+    parser.add_argument(
+        '--batch', action='store', default=None,
+        help=("CSV file with feedstock, version and optional hash columns. "
+              "All feedstocks listed are updated in a single process."))
+    parser.add_argument(
+        '--results', action='store', default='update_results.json',
+        help=("JSON file to write the outcome of each update to in batch "
+              "mode, default is update_results.json."))
+    parser.add_argument(
+        '--base_dir', default='.', type=str,
+        help='feedstock base directory in batch mode, default is current '
+             'directory')
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=None,
+        help="number of processes used to edit recipes in batch mode, "
+             "default is the number of processors.")
+    parser.add_argument(
+        '--log', default='info',
+        help='log level; debug, info, warning, error, critical')
     return parser.parse_args()
 
 
+def batch_main(args):
+    rows = read_batch_csv(args.batch)
+    results = update_recipes(
+        rows, args.base_dir, args.build_number, max_workers=args.jobs)
+    write_results(results, args.results)
+    for status in ('updated', 'unchanged', 'failed'):
+        count = sum(1 for r in results if r['status'] == status)
+        print(status + ':', count)
+    return 0
+
+
 def main():
 
     args = parse_arguments()
+
+    # set up logging
+    log_numeric_level = getattr(logging, args.log.upper(), None)
+    if not isinstance(log_numeric_level, int):
+        raise ValueError('Invalid log level: %s' % args.log)
+    logging.basicConfig(level=log_numeric_level, format=LOG_FORMAT)
+
+    if args.batch is not None:
+        return batch_main(args)
     if args.meta is None:
         try:
             recipe = CondaRecipe('meta.yaml')
@@ -65,17 +109,19 @@ def main():
     if recipe.version == new_version:
         print("Recipe already at version:", new_version)
         return
-    recipe.version = new_version
 
-    # update the hash
+    # update the version, hash and build number.  When the hash is not given
+    # the source url for the new version is needed to determine it.
     if args.hash is None:
-        recipe.hash_value = find_hash(recipe)
+        recipe.update(version=new_version)
+        hash_value = find_hash(recipe, use_cache=not args.no_source_cache)
+        if hash_value is None:
+            raise ValueError(
+                'cannot determine hash for: {}'.format(recipe.url))
+        recipe.update(hash_value=hash_value, build_number=args.build_number)
     else:
-        recipe.hash_value = args.hash
-
-    # update the build_number
-    if args.build_number is not None:
-        recipe.build_number = args.build_number
+        recipe.update(version=new_version, hash_value=args.hash,
+                      build_number=args.build_number)
 
     recipe.write(args.meta)
     print("Updated", args.meta, "to version", recipe.version)
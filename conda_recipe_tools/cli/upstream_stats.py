@@ -2,15 +2,64 @@
 # output feedstock
 
 import argparse
+import json
 import os
 import glob
+import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-from conda_recipe_tools.git import FeedStock, NotFeedstockRepo
-from conda_recipe_tools.util import get_feedstock_dirs
+from conda_recipe_tools.git import FeedStock, GitRepo, NotFeedstockRepo
+from conda_recipe_tools.repodata import CRT_CACHE_DIR
+from conda_recipe_tools.util import get_feedstock_dirs, write_json_atomic
 
+DEFAULT_CACHE_PATH = os.path.join(CRT_CACHE_DIR, 'rebase_results.json')
 
-def can_rebase(feedstock_path, upstream='conda-forge', upstream_branch='master'):
+
+def read_cache(path=DEFAULT_CACHE_PATH):
+    """ Read cached rebase results, empty if the cache cannot be read. """
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_cache(cache, path=DEFAULT_CACHE_PATH):
+    """ Atomically write cached rebase results. """
+    write_json_atomic(cache, path, indent=1, sort_keys=True)
+
+
+def _rebase_in_worktree(feedstock, upstream_ref):
+    """ rebase HEAD on upstream_ref in a temporary worktree
+
+    Returns the hash of the rebased commit or None if the rebase fails. The
+    feedstock working tree, index and branches are not modified.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='upstream_stats_')
+    worktree_path = os.path.join(tmp_dir, 'worktree')
+    try:
+        feedstock.worktree_add(worktree_path, feedstock.commit_hash)
+        try:
+            worktree = GitRepo(worktree_path)
+            # the rebased commits are discarded, the identity is irrelevant
+            complete = worktree._git([
+                '-c', 'user.name=upstream_stats',
+                '-c', 'user.email=upstream_stats@localhost',
+                'rebase', '--quiet', upstream_ref], check=False)
+            if complete.returncode:
+                worktree.rebase_abort(check=False)
+                return None
+            return worktree.rev_parse('HEAD')
+        finally:
+            feedstock.worktree_remove(worktree_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def can_rebase(feedstock_path, upstream='conda-forge', upstream_branch='master',
+               cache=None):
     """ Determine if a feedstock can be rebased against an upstream repository.
 
     Parameters
@@ -21,6 +70,12 @@ def can_rebase(feedstock_path, upstream='conda-forge', upstream_branch='master')
         Name of upstream GitHub organization, default is conda-forge.
     upstream_branch : str
         Branch of the upstream organization to test against, default is master.
+    cache : dict or None
+        Results keyed by the local and upstream commit hashes, each a
+        dictionary with upstream, can_rebase and is_exact keys.  The
+        upstream commit is found with ls-remote so cached results are
+        returned without fetching or rebasing.  New results are added.  None
+        disables caching.
 
     Returns
     -------
@@ -34,25 +89,51 @@ def can_rebase(feedstock_path, upstream='conda-forge', upstream_branch='master')
     """
     try:
         feedstock = FeedStock(feedstock_path)
-    except NotFeedstockRepo:
+    except (NotFeedstockRepo, subprocess.CalledProcessError):
         return None, False
-    original_hash = feedstock.commit_hash
     feedstock.add_remote(upstream, check=False)
+    upstream_ref = f'{upstream}/{upstream_branch}'
+    # the upstream commit is found with ls-remote, a fetch is only needed
+    # when the result is not cached
     try:
-        feedstock.fetch(upstream)
+        local_hash = feedstock.commit_hash
+        upstream_hash = feedstock.ls_remote(
+            upstream, ['refs/heads/' + upstream_branch]).get(
+                'refs/heads/' + upstream_branch)
     except subprocess.CalledProcessError:
         return None, False
-    complete = feedstock.rebase(upstream, branch=upstream_branch, check=False)
-    if complete.returncode:
-        # the rebase failed, abort it and check out original hash
-        feedstock.rebase_abort(check=False)
-        feedstock.checkout(original_hash)
-        return False, False
-    rebase_hash = feedstock.commit_hash
-    upstream_hash = feedstock.rev_parse(f'{upstream}/{upstream_branch}')
-    is_exact = (rebase_hash == upstream_hash)
-    feedstock.checkout(original_hash)
-    return True, is_exact
+    if upstream_hash is None:
+        return None, False
+    key = f'{local_hash}:{upstream_hash}'
+    if cache is not None and isinstance(cache.get(key), dict):
+        return cache[key]['can_rebase'], cache[key]['is_exact']
+    try:
+        if _rev_parse_or_none(feedstock, upstream_ref) != upstream_hash:
+            feedstock.fetch(upstream)
+            # upstream may have moved on since ls-remote
+            upstream_hash = feedstock.rev_parse(upstream_ref)
+            key = f'{local_hash}:{upstream_hash}'
+        # rebase in a disposable worktree so that local changes are untouched
+        # and feedstocks can be checked concurrently
+        rebase_hash = _rebase_in_worktree(feedstock, upstream_ref)
+    except subprocess.CalledProcessError:
+        return None, False
+    is_exact = rebase_hash is not None and rebase_hash == upstream_hash
+    result = {
+        'upstream': upstream_hash,
+        'can_rebase': rebase_hash is not None,
+        'is_exact': is_exact,
+    }
+    if cache is not None:
+        cache[key] = result
+    return result['can_rebase'], result['is_exact']
+
+
+def _rev_parse_or_none(repo, ref):
+    try:
+        return repo.rev_parse(ref)
+    except subprocess.CalledProcessError:
+        return None
 
 
 def parse_arguments():
@@ -73,6 +154,16 @@ def parse_arguments():
     parser.add_argument(
         '--base_dir', default='.', type=str,
         help='feedstock base directory, default is current directory')
+    parser.add_argument(
+        '--jobs', '-j', default=4, type=int,
+        help='number of feedstocks to check concurrently, default 4')
+    parser.add_argument(
+        '--cache', default=DEFAULT_CACHE_PATH,
+        help=('file of results keyed by local and upstream commit, '
+              'default ' + DEFAULT_CACHE_PATH))
+    parser.add_argument(
+        '--no-cache', action='store_true', dest='no_cache',
+        help='do not read or update the results cache')
     parser.add_argument(
         "--no_header", action='store_true',
         help='Do not print header line, helpful when appending to a file')
@@ -87,16 +178,23 @@ def main():
     else:
         dirs = get_feedstock_dirs(args.feedstock_dir, args.file)
         feedstock_paths = [os.path.join(args.base_dir, d) for d in dirs]
+    cache = None if args.no_cache else read_cache(args.cache)
     if not args.no_header:
         print("pkg_name,can_rebase,exact_rebase")
-    for feedstock_path in feedstock_paths:
-        can_be_rebased, is_exact = can_rebase(feedstock_path, args.upstream)
-        pkg_name = (
-            feedstock_path
-            .replace('./', '')
-            .replace('/', '')
-            .replace('-feedstock', ''))
-        print(f'{pkg_name},{can_be_rebased},{is_exact}')
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+        results = executor.map(
+            lambda path: can_rebase(path, args.upstream, cache=cache),
+            feedstock_paths)
+        for feedstock_path, (can_be_rebased, is_exact) in zip(
+                feedstock_paths, results):
+            pkg_name = (
+                feedstock_path
+                .replace('./', '')
+                .replace('/', '')
+                .replace('-feedstock', ''))
+            print(f'{pkg_name},{can_be_rebased},{is_exact}', flush=True)
+    if cache is not None:
+        write_cache(cache, args.cache)
 
 
 if __name__ == "__main__":
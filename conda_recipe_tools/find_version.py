@@ -1,6 +1,12 @@
 """ Looks version for projects. """
 
+import html
+import inspect
 import re
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
 
 from bs4 import BeautifulSoup
 
@@ -8,13 +14,314 @@ import feedparser
 
 import requests
 
+from conda_recipe_tools.pypi_metadata import PYPI_CACHE
+
 try:
     from packaging.version import parse as parse_version
 except ImportError:
     from pip._vendor.packaging.version import parse as parse_version
 
+# matches an anchor tag, capturing the href value (in one of three quoting
+# styles) and the text up to the next tag.  The trailing lookahead ensures the
+# anchor text is complete before a match is reported.
+_ANCHOR_RE = re.compile(
+    rb"""<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+))[^>]*>"""
+    rb"""([^<]*)(?=<)""", re.IGNORECASE)
+_ANCHOR_START_RE = re.compile(rb'<a[\s>]', re.IGNORECASE)
+# partial anchors longer than this are assumed to be junk and dropped
+_MAX_ANCHOR_TAIL = 64 * 1024
+_CHUNK_SIZE = 64 * 1024
+
+# timeout in seconds for an individual request to an upstream server
+DEFAULT_TIMEOUT = 30
+# seconds a lookup result remains valid for sources without their own
+DEFAULT_CACHE_TTL = 12 * 3600
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class HostUnavailable(Exception):
+    pass
+
+
+class NotModified(Exception):
+    pass
+
+
+class LookupBudget(object):
+    """
+    Time budget shared by a series of version lookups.
+
+    Parameters
+    ----------
+    timeout : float
+        Timeout in seconds for each request made to an upstream server.
+    deadline : float or None
+        Number of seconds from now after which no further requests are made,
+        None for no deadline.
+    max_host_failures : int
+        Number of consecutive failed requests to a host after which the host
+        is skipped for the remainder of the lookups.
+
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, deadline=None,
+                 max_host_failures=3):
+        self.timeout = timeout
+        if deadline is None:
+            self._end = None
+        else:
+            self._end = time.monotonic() + deadline
+        self.max_host_failures = max_host_failures
+        self._failures = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """ Seconds remaining until the deadline, None if there is none. """
+        if self._end is None:
+            return None
+        return self._end - time.monotonic()
+
+    def request_timeout(self):
+        """ Return the timeout for a request, limited by the deadline. """
+        remaining = self.remaining()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            raise DeadlineExceeded('lookup deadline exceeded')
+        return min(self.timeout, remaining)
+
+    def check_deadline(self):
+        """ Raise DeadlineExceeded if the deadline has passed. """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded('lookup deadline exceeded')
+
+    def check_host(self, host):
+        """ Raise HostUnavailable if a host has failed too many times. """
+        with self._lock:
+            failures = self._failures[host]
+        if failures >= self.max_host_failures:
+            raise HostUnavailable('skipping host: {}'.format(host))
+
+    def record(self, host, success):
+        """ Record the outcome of a request to a host. """
+        with self._lock:
+            if success:
+                self._failures[host] = 0
+            else:
+                self._failures[host] += 1
+
+    def get(self, url, **kwargs):
+        """ requests.get with a timeout and circuit breaker applied. """
+        host = urlparse(url).netloc
+        self.check_host(host)
+        timeout = self.request_timeout()
+        try:
+            r = requests.get(url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            self.record(host, False)
+            self.check_deadline()
+            raise
+        self.record(host, r.status_code < 500)
+        return r
+
+    def conditional(self, validators=None):
+        """ Return a view of the budget which makes conditional requests.
+
+        Parameters
+        ----------
+        validators : dict or None
+            Dictionary mapping URLs to the validators (etag and/or
+            last_modified) from a previous response.
+
+        Returns
+        -------
+        budget : ConditionalBudget
+            Budget sharing the deadline and host failures of this budget.
+
+        """
+        return ConditionalBudget(self, validators)
+
+
+class ConditionalBudget(object):
+    """
+    View of a LookupBudget which sends If-None-Match and If-Modified-Since
+    headers for URLs with known validators.
+
+    NotModified is raised from get when the server indicates the resource has
+    not changed.  The validators attribute contains the validators of the
+    responses received through this view.
+    """
+
+    def __init__(self, budget, validators=None):
+        self._budget = budget
+        self._previous = validators or {}
+        self.validators = {}
+
+    def __getattr__(self, name):
+        return getattr(self._budget, name)
+
+    def get(self, url, headers=None, **kwargs):
+        headers = dict(headers or {})
+        previous = self._previous.get(url, {})
+        if 'etag' in previous:
+            headers['If-None-Match'] = previous['etag']
+        if 'last_modified' in previous:
+            headers['If-Modified-Since'] = previous['last_modified']
+        r = self._budget.get(url, headers=headers, **kwargs)
+        if r.status_code == 304 and previous:
+            self.validators[url] = previous
+            raise NotModified(url)
+        validator = {}
+        if r.headers.get('ETag'):
+            validator['etag'] = r.headers['ETag']
+        if r.headers.get('Last-Modified'):
+            validator['last_modified'] = r.headers['Last-Modified']
+        if validator:
+            self.validators[url] = validator
+        return r
+
+
+class VersionSource(object):
+    """
+    A source from which the latest version of a project can be determined.
+
+    Parameters
+    ----------
+    name : str
+        Name of the source, this is the update_type used to select it.
+    func : callable
+        Function called as func(name, extra, budget) which returns the latest
+        version of the project or None when this cannot be determined.  All
+        requests should be made using the budget, a LookupBudget instance.
+        Functions written for the earlier func(name, extra) signature are
+        still called without the budget.  The deadline and host checks are
+        applied before the call but their requests are not bounded by the
+        budget timeouts.
+    host : str or None
+        Host queried by the source.  None indicates that the host depends on
+        the project and is taken from the url entry in extra.
+    max_workers : int
+        Maximum number of concurrent lookups against this source.
+    cache_ttl : int or None
+        Number of seconds a lookup result from this source remains valid,
+        None to use DEFAULT_CACHE_TTL.
+
+    """
+
+    def __init__(self, name, func, host=None, max_workers=4, cache_ttl=None):
+        self.name = name
+        self.func = func
+        self.host = host
+        self.max_workers = max_workers
+        self.cache_ttl = cache_ttl
+        self._semaphore = threading.BoundedSemaphore(max_workers)
+        self._takes_budget = _takes_budget(func)
+
+    def host_for(self, extra):
+        """ Return the host which will be queried for a project. """
+        if self.host is not None:
+            return self.host
+        url = extra.get('url')
+        if url is None:
+            return None
+        return urlparse(url).netloc
+
+    def find(self, name, extra, budget):
+        """ Find the latest version of a project from this source. """
+        host = self.host_for(extra)
+        if host is not None:
+            budget.check_host(host)
+        with self._semaphore:
+            budget.check_deadline()
+            if not self._takes_budget:
+                return self.func(name, extra)
+            return self.func(name, extra, budget)
+
+
+def _takes_budget(func):
+    """ False for source functions with the func(name, extra) signature. """
+    try:
+        inspect.signature(func).bind(None, None, None)
+    except TypeError:
+        return False
+    except ValueError:
+        # no signature available, assume the current signature
+        pass
+    return True
+
+
+# name of the entry point group which third party sources are loaded from,
+# each entry point should refer to a VersionSource instance.
+ENTRY_POINT_GROUP = 'conda_recipe_tools.version_sources'
+
+SOURCES = {}
+_entry_points_loaded = False
+
+
+def register_source(source):
+    """ Register a VersionSource under its name. """
+    SOURCES[source.name] = source
+    return source
+
+
+def get_source(name, update_type='pypi'):
+    """ Return the VersionSource used for a project, None if there is none. """
+    _load_entry_point_sources()
+    if update_type == 'custom':
+        return CUSTOM.get(name)
+    return SOURCES.get(update_type)
 
-def find_latest_version(name, update_type='pypi', extra=None, extra_str=None):
+
+def _load_entry_point_sources():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    for entry_point in _iter_entry_points(ENTRY_POINT_GROUP):
+        register_source(entry_point.load())
+
+
+def _iter_entry_points(group):
+    try:
+        from importlib import metadata
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        return pkg_resources.iter_entry_points(group)
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        return eps.select(group=group)
+    return eps.get(group, [])
+
+
+def parse_extra_str(extra_str):
+    """ Parse a key1=value1;key2=value2 string into a dictionary. """
+    if not extra_str:
+        return {}
+    return dict(s.split('=', 1) for s in extra_str.split(';'))
+
+
+def compile_extra(extra):
+    """ Return a copy of extra with any regular expressions compiled.
+
+    The regex entry and the tag_prefix entry, a | separated list of
+    additional prefixes to remove from tags, are compiled so that they do not
+    need to be processed on each lookup.
+    """
+    compiled = dict(extra)
+    if isinstance(compiled.get('regex'), str):
+        compiled['regex'] = re.compile(compiled['regex'])
+    if isinstance(compiled.get('tag_prefix'), str):
+        prefixes = compiled['tag_prefix'].split('|')
+        compiled['tag_prefix'] = _compile_prefixes(prefixes)
+    return compiled
+
+
+def find_latest_version(name, update_type='pypi', extra=None, extra_str=None,
+                        budget=None):
     """ Find the latest version for a given project.
 
     Parameters
@@ -27,6 +334,9 @@ def find_latest_version(name, update_type='pypi', extra=None, extra_str=None):
             * url : Look up version by parsing a URL.
             * github : Find version from GitHub release.
             * custom : Use one of the custom lookup function.
+        Additional options can be provided by sources registered with
+        register_source or through the conda_recipe_tools.version_sources
+        entry point group.
     extra : None or dict
         Additional parameters passed to the update method that are used when
         determining the latest version.
@@ -34,44 +344,47 @@ def find_latest_version(name, update_type='pypi', extra=None, extra_str=None):
         A string encoding the extra dictionary parameters with format:
         key1=value1;key2=value2
         If extra_str is not None, the extra parameter is ignored.
+    budget : LookupBudget or None
+        Timeouts and deadline which limit the lookup.  None will use a
+        LookupBudget with the default timeout and no deadline.
 
     Returns
     -------
     version : Version or None
         The latest version, None when this cannot be determined.
 
+    Raises
+    ------
+    DeadlineExceeded
+        When the deadline of the budget passes before the lookup completes.
+    HostUnavailable
+        When the host needed for the lookup has failed repeatedly.
+    NotModified
+        When budget is a ConditionalBudget and the upstream reports that the
+        information used to determine the version has not changed.
+
     """
     if extra_str is not None:
-        if extra_str == '':
-            extra = {}
-        else:
-            extra = dict(s.split('=') for s in extra_str.split(';'))
+        extra = compile_extra(parse_extra_str(extra_str))
     if extra is None:
         extra = {}
-    if update_type == 'pypi':
-        return _find_latest_version_pypi(name, extra)
-    elif update_type == 'url':
-        return _find_latest_version_url(name, extra)
-    elif update_type == 'github':
-        return _find_latest_version_github(name, extra)
-    elif update_type == 'custom':
-        if name in CUSTOM:
-            return CUSTOM[name]()
-        else:
-            return None
-    else:
+    source = get_source(name, update_type)
+    if source is None:
         return None
+    if budget is None:
+        budget = LookupBudget()
+    return source.find(name, extra, budget)
 
 
-def _find_latest_version_pypi(name, extra):
+def _find_latest_version_pypi(name, extra, budget):
     pypi_name = extra.get('pypi_name', name)
-    url = 'https://pypi.org/pypi/{}/json'.format(pypi_name)
-    r = requests.get(url)
-    payload = r.json()
-    return parse_version(payload['info']['version'])
+    version = PYPI_CACHE.latest_version(pypi_name, get=budget.get)
+    if version is None:
+        return None
+    return parse_version(version)
 
 
-def _find_latest_version_url(name, extra):
+def _find_latest_version_url(name, extra, budget):
     url = extra.get('url')
     regex = extra.get('regex', name+'-(.*).tar.gz')
     filter_prerelease = bool(extra.get('filter_pre', False))
@@ -81,17 +394,13 @@ def _find_latest_version_url(name, extra):
         raw = True
     if url is None:
         return None
-    r = requests.get(url)
-    soup = BeautifulSoup(r.text, 'lxml')
     versions = []
-    for link in soup.find_all('a', href=True):
-        match = re.match(regex, link['href'])
-        if match:
-            if raw:
-                versions.append(ver_format.format(*match.groups()))
-            else:
-                ver_str = match.group(1)
-                versions.append(parse_version(ver_str))
+    for match in _match_links(url, regex, budget):
+        if raw:
+            versions.append(ver_format.format(*match.groups()))
+        else:
+            ver_str = match.group(1)
+            versions.append(parse_version(ver_str))
     if len(versions) == 0:
         return None
     if filter_prerelease:
@@ -102,17 +411,117 @@ def _find_latest_version_url(name, extra):
     return latest_version
 
 
-def _find_latest_version_github(name, extra):
+def _match_links(url, regex, budget, use_text=False):
+    """ Return regex matches against the links on a web page.
+
+    The page is streamed and anchor tags are extracted from the raw bytes as
+    they arrive, without building a DOM.  BeautifulSoup is only used as a
+    fallback when no anchor tags can be found, which suggests that the page is
+    malformed.
+
+    Parameters
+    ----------
+    url : str
+        URL of the page to examine.
+    regex : str or compiled regular expression
+        Pattern matched (with re.match) against each link.
+    budget : LookupBudget
+        Budget used to limit the time spent fetching the page.
+    use_text : bool
+        True to match against the text of the link, False to match against
+        the href attribute.
+
+    Returns
+    -------
+    matches : list of re.Match
+        Successful matches in the order the links appear on the page.
+
+    """
+    regex = re.compile(regex)
+    r = budget.get(url, stream=True)
+    chunks = []
+    matches = []
+    found_anchor = False
+    content = _iter_content_with_deadline(r, budget)
+    for href, text in _iter_anchors(content, chunks):
+        found_anchor = True
+        match = regex.match(text if use_text else href)
+        if match:
+            matches.append(match)
+    if not found_anchor:
+        soup = BeautifulSoup(b''.join(chunks), 'lxml')
+        for link in soup.find_all('a', href=True):
+            if use_text:
+                if not link.contents:
+                    continue
+                value = str(link.contents[0])
+            else:
+                value = link['href']
+            match = regex.match(value)
+            if match:
+                matches.append(match)
+    return matches
+
+
+def _iter_content_with_deadline(r, budget):
+    for chunk in r.iter_content(_CHUNK_SIZE):
+        budget.check_deadline()
+        yield chunk
+
+
+def _iter_anchors(chunks, seen=None):
+    """ Yield (href, text) for each anchor tag in a stream of byte chunks.
+
+    Chunks are appended to seen, when provided, so the caller can re-parse
+    the page if required.
+    """
+    buf = b''
+    for chunk in chunks:
+        if seen is not None:
+            seen.append(chunk)
+        buf += chunk
+        pos = 0
+        for match in _ANCHOR_RE.finditer(buf):
+            href = next(g for g in match.groups()[:3] if g is not None)
+            yield (_decode_html(href), _decode_html(match.group(4)))
+            pos = match.end()
+        # keep any trailing incomplete anchor tag for the next chunk
+        tail = None
+        for start in _ANCHOR_START_RE.finditer(buf, pos):
+            tail = start.start()
+        if tail is None:
+            tail = buf.rfind(b'<', pos)
+            if tail == -1 or len(buf) - tail > 2:
+                tail = len(buf)
+        buf = buf[tail:]
+        if len(buf) > _MAX_ANCHOR_TAIL:
+            # drop the oversized partial anchor but keep any tag started at
+            # its end, which the next chunk may complete as an anchor
+            last = buf.rfind(b'<', 1)
+            buf = buf[last:] if last != -1 else b''
+            if len(buf) > _MAX_ANCHOR_TAIL:
+                buf = b''
+
+
+def _decode_html(raw):
+    return html.unescape(raw.decode('utf-8', errors='replace')).strip()
+
+
+def _find_latest_version_github(name, extra, budget):
     org = extra.get('gh_org', name)
     repo = extra.get('gh_repo', name)
     url = "https://github.com/{}/{}/releases.atom".format(org, repo)
-    return _max_version_from_feed(url)
+    return _max_version_from_feed(url, budget, extra.get('tag_prefix'))
 
 
-def _max_version_from_feed(url):
-    data = feedparser.parse(url)
+def _max_version_from_feed(url, budget, tag_prefix=None):
+    # feedparser has no timeout option, fetch the feed with the budget
+    r = budget.get(url)
+    data = feedparser.parse(r.content)
     raw_versions = [e['link'].split('/')[-1] for e in data['entries']]
     clean_versions = [_clean_version_str(v) for v in raw_versions]
+    if tag_prefix is not None:
+        clean_versions = [tag_prefix.sub('', v) for v in clean_versions]
     versions = [parse_version(v) for v in clean_versions]
     filtered = [v for v in versions if not
                 (v.is_prerelease or v.is_postrelease)]
@@ -121,88 +530,111 @@ def _max_version_from_feed(url):
     return max(filtered)
 
 
+def _compile_prefixes(prefixes):
+    """ Compile a regex which removes prefixes in the order given. """
+    optional = ''.join('(?:{})?'.format(re.escape(p)) for p in prefixes)
+    return re.compile('^' + optional)
+
+
+_VER_PREFIX_RE = _compile_prefixes([
+    'release-',
+    'releases%2F',
+    'rel%2Frelease-',
+    'v',
+    'r',
+    'version-',
+    'cyrus-sasl-',
+    'gd-',
+    'apache-parquet-cpp-',
+    'apache-arrow-',
+    'LMDB_',
+    'xar-',
+    'zopfli-',
+])
+
+
 def _clean_version_str(ver):
-    ver_prefix_remove = [
-        'release-',
-        'releases%2F',
-        'rel%2Frelease-',
-        'v',
-        'r',
-        'version-',
-        'cyrus-sasl-',
-        'gd-',
-        'apache-parquet-cpp-',
-        'apache-arrow-',
-        'LMDB_',
-        'xar-',
-        'zopfli-',
-    ]
-    for prefix in ver_prefix_remove:
-        if ver.startswith(prefix):
-            ver = ver[len(prefix):]
-    return ver
-
-
-def _find_latest_tbb():
+    return _VER_PREFIX_RE.sub('', ver, count=1)
+
+
+_TBB_LINK_RE = re.compile(r'(?:.*)/([\d_U]+).tar.gz')
+_TBB_UPDATE_RE = re.compile(r'(\d+)_U(\d+)')
+_GRAPHVIZ_LINK_RE = re.compile(r'graphviz-(.*).tar.gz')
+
+
+def _find_latest_tbb(name, extra, budget):
     url = 'https://github.com/01org/tbb/releases'
-    regex = '(?:.*)/([\d_U]+).tar.gz'
-    r = requests.get(url)
-    soup = BeautifulSoup(r.text)
     versions = []
-    for link in soup.find_all('a', href=True):
-        match = re.match(regex, link.get('href'))
-        if match:
-            raw_ver_str = match.group(1)
-            if '_U' in raw_ver_str:
-                # YYYY_UX
-                match2 = re.match('(\d+)_U(\d+)', raw_ver_str)
-                ver_str = '{}.{}'.format(*match2.groups())
-            else:
-                # YYYY
-                ver_str = raw_ver_str + '.0'
-            versions.append(parse_version(ver_str))
+    for match in _match_links(url, _TBB_LINK_RE, budget):
+        raw_ver_str = match.group(1)
+        if '_U' in raw_ver_str:
+            # YYYY_UX
+            match2 = _TBB_UPDATE_RE.match(raw_ver_str)
+            ver_str = '{}.{}'.format(*match2.groups())
+        else:
+            # YYYY
+            ver_str = raw_ver_str + '.0'
+        versions.append(parse_version(ver_str))
     if len(versions) == 0:
         return None
     return max(versions)
 
 
-def _find_latest_graphviz():
+def _find_latest_graphviz(name, extra, budget):
     url = "https://graphviz.gitlab.io/_pages/Download/Download_source.html"
-    r = requests.get(url)
-    soup = BeautifulSoup(r.text)
-    regex = 'graphviz-(.*).tar.gz'
     versions = []
-    for link in soup.find_all('a', href=True):
-        match = re.match(regex, link.contents[0])
-        if match:
-            ver_str = match.group(1)
-            # skip long developement snapshots
-            if len(ver_str) > 10:
-                continue
-            versions.append(parse_version(ver_str))
+    for match in _match_links(url, _GRAPHVIZ_LINK_RE, budget, use_text=True):
+        ver_str = match.group(1)
+        # skip long developement snapshots
+        if len(ver_str) > 10:
+            continue
+        versions.append(parse_version(ver_str))
     if len(versions) == 0:
         return None
     return max(versions)
 
 
-def _find_latest_hdfeos2():
+_HDFEOS2_FILE_RE = re.compile(r'(?:.*)HDF-EOS(.*)v1.00.tar.Z')
+
+
+def _find_latest_hdfeos2(name, extra, budget):
     from ftplib import FTP
+    host = 'edhs1.gsfc.nasa.gov'
+    timeout = budget.request_timeout()
     try:
-        ftp = FTP('edhs1.gsfc.nasa.gov')
+        ftp = FTP(host, timeout=timeout)
         ftp.login()
         files = ftp.nlst('edhs/hdfeos/latest_release/')
         ftp.close()
-    except:
+    except Exception:
+        budget.record(host, False)
         return None
+    budget.record(host, True)
     for filename in files:
-        match = re.match('(?:.*)HDF-EOS(.*)v1.00.tar.Z', filename)
+        match = _HDFEOS2_FILE_RE.match(filename)
         if match:
             return parse_version(match.group(1))
     return None
 
 
+register_source(VersionSource(
+    'pypi', _find_latest_version_pypi, host='pypi.org', max_workers=8,
+    cache_ttl=DEFAULT_CACHE_TTL))
+register_source(VersionSource(
+    'url', _find_latest_version_url, cache_ttl=DEFAULT_CACHE_TTL))
+register_source(VersionSource(
+    'github', _find_latest_version_github, host='github.com',
+    cache_ttl=DEFAULT_CACHE_TTL))
+
+# custom lookups for individual projects, used when update_type is custom
 CUSTOM = {
-    'graphviz': _find_latest_graphviz,
-    'hdfeos2': _find_latest_hdfeos2,
-    'tbb': _find_latest_tbb,
+    'graphviz': VersionSource(
+        'graphviz', _find_latest_graphviz, host='graphviz.gitlab.io',
+        max_workers=1, cache_ttl=7 * 24 * 3600),
+    'hdfeos2': VersionSource(
+        'hdfeos2', _find_latest_hdfeos2, host='edhs1.gsfc.nasa.gov',
+        max_workers=1, cache_ttl=7 * 24 * 3600),
+    'tbb': VersionSource(
+        'tbb', _find_latest_tbb, host='github.com',
+        max_workers=1, cache_ttl=7 * 24 * 3600),
 }
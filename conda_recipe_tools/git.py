@@ -1,24 +1,114 @@
 """ Interactions with git repositories. """
 
+import functools
 import logging
 import subprocess
 from subprocess import PIPE
 import os
+import threading
+import time
+
+from conda_recipe_tools.git_backend import BackendUnsupported, get_backend
+
+
+@functools.lru_cache(maxsize=None)
+def _git_env():
+    """ environment for git commands, copied from os.environ once """
+    env = os.environ.copy()
+    # set GIT_TERMINAL_PROMPT to 0 to disable prompting for credentials
+    # https://serverfault.com/a/665959
+    env['GIT_TERMINAL_PROMPT'] = '0'
+    return env
+
+
+class GitObjectError(Exception):
+    pass
 
 
 class GitRepo(object):
+    """
+    A git repository.
 
-    def __init__(self, path):
+    Parameters
+    ----------
+    path : str
+        Path to the repository.
+    deadline : float or None
+        time.monotonic() value after which git commands are no longer run.
+        Commands still running at the deadline are killed and
+        subprocess.TimeoutExpired is raised.  None for no deadline.
+    backend : str or None
+        In-process backend used for read-only queries, see
+        conda_recipe_tools.git_backend.get_backend.  Queries the backend
+        cannot answer run git instead.
+    """
+
+    def __init__(self, path, deadline=None, backend=None):
         self._path = path
+        self.deadline = deadline
+        self._cat_file = None
+        self._cat_file_lock = threading.Lock()
+        self._backend_name = backend
+        self._backend = None
+        self._backend_loaded = False
+
+    @property
+    def path(self):
+        return self._path
+
+    def _in_process(self, operation, *args):
+        """ answer a query in-process, raises BackendUnsupported if not """
+        if not self._backend_loaded:
+            self._backend = get_backend(self._path, self._backend_name)
+            self._backend_loaded = True
+        if self._backend is None:
+            raise BackendUnsupported('no in-process backend')
+        try:
+            return getattr(self._backend, operation)(*args)
+        except BackendUnsupported as exc:
+            logging.debug('%s backend: %s', self._backend.name, exc)
+            raise
+        except (OSError, ValueError, KeyError, IndexError) as exc:
+            logging.debug('%s backend failed: %s', self._backend.name, exc)
+            raise BackendUnsupported(str(exc))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Stop the git cat-file process used to read objects, if any. """
+        with self._cat_file_lock:
+            if self._cat_file is None:
+                return
+            proc, self._cat_file = self._cat_file, None
+            proc.stdin.close()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
+    def _timeout(self, args):
+        """ seconds remaining before the deadline, None if not set """
+        if self.deadline is None:
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(args, 0)
+        return remaining
 
     def _git(self, git_args, check=True):
-        args = ['git', '-C', self._path] + git_args
+        return self._run(['git', '-C', self._path] + git_args, check)
+
+    def _run(self, args, check=True):
         logging.debug('command: ' + ' '.join(args))
-        # set GIT_TERMINAL_PROMPT to 0 to disable prompting for credentials
-        # https://serverfault.com/a/665959
-        env = os.environ.copy()
-        env['GIT_TERMINAL_PROMPT'] = '0'
-        complete = subprocess.run(args, stdout=PIPE, stderr=PIPE, env=env)
+        complete = subprocess.run(
+            args, stdout=PIPE, stderr=PIPE, env=_git_env(),
+            timeout=self._timeout(args))
         logging.debug('returncode: ' + str(complete.returncode))
         logging.debug('stdout: ' + complete.stdout.decode('utf-8'))
         logging.debug('stderr: ' + complete.stderr.decode('utf-8'))
@@ -26,8 +116,171 @@ class GitRepo(object):
             complete.check_returncode()
         return complete
 
-    def clone(self, url):
-        return self._git(['clone', url, self._path])
+    def _start_cat_file(self):
+        args = ['git', '-C', self._path, 'cat-file', '--batch']
+        logging.debug('command: ' + ' '.join(args))
+        return subprocess.Popen(
+            args, stdin=PIPE, stdout=PIPE, stderr=subprocess.DEVNULL,
+            env=_git_env())
+
+    def read_object(self, name):
+        """
+        Read an object from the repository.
+
+        All reads from a repository are served by a single long running
+        ``git cat-file --batch`` process which is started on the first read
+        and stopped by close().  When the deadline passes during a read the
+        process is killed and subprocess.TimeoutExpired is raised.
+
+        Parameters
+        ----------
+        name : str
+            Any object name understood by git, for example a commit hash or
+            ``origin/master:recipe/meta.yaml``.
+
+        Returns
+        -------
+        obj_type : str or None
+            Object type, blob, tree, commit or tag.  None if the object
+            does not exist.
+        content : bytes or None
+            Raw content of the object, None if the object does not exist.
+        """
+        if '\n' in name:
+            raise ValueError('object name contains a newline: %r' % name)
+        request = name.encode('utf-8')
+        with self._cat_file_lock:
+            if self._cat_file is None:
+                self._cat_file = self._start_cat_file()
+            proc = self._cat_file
+            # a deadline kills the process, ending any read which is blocked
+            timeout = self._timeout(proc.args)
+            timer = None
+            if timeout is not None:
+                timer = threading.Timer(timeout, proc.kill)
+                timer.start()
+            try:
+                proc.stdin.write(request + b'\n')
+                proc.stdin.flush()
+                header = proc.stdout.readline()
+                # the reply to a missing object repeats the name, which may
+                # contain spaces
+                if header in (request + b' missing\n',
+                              request + b' ambiguous\n'):
+                    return None, None
+                fields = header.split()
+                if len(fields) != 3:
+                    raise GitObjectError(
+                        'unexpected cat-file output: %r' % header)
+                size = int(fields[2])
+                content = proc.stdout.read(size)
+                proc.stdout.read(1)  # trailing newline
+                if len(content) != size:
+                    raise GitObjectError('short read from git cat-file')
+            except (OSError, ValueError, GitObjectError) as exc:
+                # the process is unusable, start a new one on the next read
+                self._cat_file = None
+                proc.kill()
+                if timer is not None and not timer.is_alive():
+                    raise subprocess.TimeoutExpired(proc.args, timeout)
+                if isinstance(exc, GitObjectError):
+                    raise
+                raise GitObjectError('git cat-file failed in ' + self._path)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+        return fields[1].decode('ascii'), content
+
+    def read_blob(self, rev, path):
+        """ Content of the file at path in rev as bytes, None if missing. """
+        obj_type, content = self.read_object('%s:%s' % (rev, path))
+        if obj_type != 'blob':
+            return None
+        return content
+
+    def read_tree(self, rev, path=''):
+        """
+        Entries of the directory at path in rev.
+
+        Returns a list of (mode, name, object hash) tuples or None if the
+        directory does not exist.
+        """
+        obj_type, content = self.read_object('%s:%s' % (rev, path))
+        if obj_type != 'tree':
+            return None
+        entries = []
+        pos = 0
+        # each entry is "<mode> <name>\0<20 byte binary hash>"
+        while pos < len(content):
+            space = content.index(b' ', pos)
+            nul = content.index(b'\0', space)
+            entries.append((
+                content[pos:space].decode('ascii'),
+                content[space + 1:nul].decode('utf-8', 'surrogateescape'),
+                content[nul + 1:nul + 21].hex()))
+            pos = nul + 21
+        return entries
+
+    def clone(self, url, reference=None, filter=None, bare=False):
+        """
+        Clone url into the repository path.
+
+        Parameters
+        ----------
+        url : str
+            URL or path of the repository to clone.
+        reference : str or None
+            Path to a repository, for example an ObjectStore, whose objects
+            are borrowed through alternates instead of being downloaded.
+            Ignored when the path does not exist.
+        filter : str or None
+            Partial clone filter, for example ``blob:none`` to download file
+            contents only when they are needed.
+        bare : bool
+            Create a bare repository.
+        """
+        cmd = ['git', 'clone']
+        if reference is not None:
+            cmd.extend(['--reference-if-able', reference])
+        if filter is not None:
+            cmd.append('--filter=' + filter)
+        if bare:
+            cmd.append('--bare')
+        return self._run(cmd + [url, self._path])
+
+    @property
+    def common_dir(self):
+        """ path to the git directory shared by all worktrees """
+        out = self._git(['rev-parse', '--git-common-dir'])
+        return os.path.join(self._path, out.stdout.decode('utf-8').strip())
+
+    def alternates(self):
+        """ list of object directories borrowed by the repository """
+        path = os.path.join(self.common_dir, 'objects', 'info', 'alternates')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [l.strip() for l in f if l.strip() and l[0] != '#']
+
+    def add_alternate(self, objects_dir, repack=True):
+        """
+        Borrow objects from another object directory.
+
+        When repack is True, objects which are available from the alternate
+        are removed from the repository with ``git repack -a -d -l``.
+        """
+        objects_dir = os.path.abspath(objects_dir)
+        if objects_dir not in self.alternates():
+            path = os.path.join(
+                self.common_dir, 'objects', 'info', 'alternates')
+            with open(path, 'a') as f:
+                f.write(objects_dir + '\n')
+        if repack:
+            self.repack()
+
+    def repack(self):
+        """ repack objects, dropping those available from alternates """
+        return self._git(['repack', '-a', '-d', '-l', '-q'])
 
     def checkout(self, branch='master'):
         return self._git(['checkout', branch])
@@ -35,6 +288,30 @@ class GitRepo(object):
     def fetch(self, remote='origin'):
         return self._git(['fetch', remote])
 
+    def ls_remote(self, remote, patterns=()):
+        """
+        Refs advertised by a remote without fetching anything.
+
+        Parameters
+        ----------
+        remote : str
+            Remote name or URL.
+        patterns : list of str
+            Only list refs matching these patterns, for example
+            refs/heads/master.  All refs are listed when empty.
+
+        Returns
+        -------
+        refs : dict
+            Dictionary mapping ref names to object hashes.
+        """
+        out = self._git(['ls-remote', remote] + list(patterns))
+        refs = {}
+        for line in out.stdout.decode('utf-8').splitlines():
+            sha, refname = line.split('\t', 1)
+            refs[refname] = sha
+        return refs
+
     def reset_hard(self, remote='origin', branch='master'):
         return self._git(['reset', '--hard', '%s/%s' % (remote, branch)])
 
@@ -51,6 +328,16 @@ class GitRepo(object):
             return self._git(['push', '--force', remote, refspec], check)
         return self._git(['push', remote, refspec], check)
 
+    def worktree_add(self, path, commit='HEAD'):
+        """ add a worktree at path with a detached HEAD at commit """
+        return self._git(['worktree', 'add', '--detach', '--quiet', path,
+                          commit])
+
+    def worktree_remove(self, path):
+        """ remove a worktree, discarding any changes in it """
+        self._git(['worktree', 'remove', '--force', path], check=False)
+        return self._git(['worktree', 'prune'])
+
     def branch(self, branch_name):
         return self._git(['checkout', '-b', branch_name])
 
@@ -69,19 +356,61 @@ class GitRepo(object):
         out = self._git(cmd)
         return out.stdout.decode('utf-8')
 
+    def is_dirty(self, path=None):
+        """ True if tracked files, under path if given, have changes """
+        cmd = ['status', '--porcelain', '--untracked-files=no']
+        if path is not None:
+            cmd.extend(['--', path])
+        out = self._git(cmd)
+        return bool(out.stdout.strip())
+
     def ls_files_modified(self):
+        try:
+            return self._in_process('ls_files_modified')
+        except BackendUnsupported:
+            pass
         out = self._git(['ls-files', '-m'])
         return out.stdout.decode('utf-8').split()
 
     def rev_parse(self, arg):
+        try:
+            return self._in_process('rev_parse', arg)
+        except BackendUnsupported:
+            pass
         out = self._git(['rev-parse', arg])
         return out.stdout.decode('utf-8').strip()
 
+    def config_get(self, key):
+        """ value of a git config key """
+        try:
+            return self._in_process('config_get', key)
+        except BackendUnsupported:
+            pass
+        out = self._git(['config', '--get', key])
+        return out.stdout.decode('utf-8').strip()
+
+    def list_refs(self, prefix='refs/'):
+        """ dictionary of ref names starting with prefix to object hashes """
+        try:
+            return self._in_process('list_refs', prefix)
+        except BackendUnsupported:
+            pass
+        cmd = ['for-each-ref', '--format=%(objectname) %(refname)']
+        if prefix.endswith('/'):
+            cmd.append(prefix)
+        out = self._git(cmd)
+        refs = {}
+        for line in out.stdout.decode('utf-8').splitlines():
+            sha, refname = line.split(' ', 1)
+            # for-each-ref matches whole path components, list_refs prefixes
+            if refname.startswith(prefix):
+                refs[refname] = sha
+        return refs
+
     @property
     def commit_hash(self):
         """ commit hash for the current HEAD """
-        out = self._git(['rev-parse', 'HEAD'])
-        return out.stdout.decode('utf-8').strip()
+        return self.rev_parse('HEAD')
 
 
 class NotFeedstockRepo(Exception):
@@ -90,11 +419,11 @@ class NotFeedstockRepo(Exception):
 
 class FeedStock(GitRepo):
 
-    def __init__(self, path, feedstock_name=None):
-        super(FeedStock, self).__init__(path)
+    def __init__(self, path, feedstock_name=None, deadline=None,
+                 backend=None):
+        super(FeedStock, self).__init__(path, deadline, backend)
         if feedstock_name is None:
-            out = self._git(['config', '--get', 'remote.origin.url'])
-            origin_url = out.stdout.decode('utf-8').strip()
+            origin_url = self.config_get('remote.origin.url')
             feedstock_name = origin_url.split('/')[-1]
             if feedstock_name.endswith('.git'):
                 feedstock_name = feedstock_name[:-4]
@@ -102,8 +431,19 @@ class FeedStock(GitRepo):
             raise NotFeedstockRepo('not a feedstock: %s' % (feedstock_name))
         self._feedstock_name = feedstock_name
 
+    def remote_url(self, org):
+        """ URL of the feedstock repository in a GitHub organization """
+        return 'https://github.com/%s/%s' % (org, self._feedstock_name)
+
     def add_remote(self, org, remote_name=None, check=True):
-        url = 'https://github.com/%s/%s' % (org, self._feedstock_name)
+        url = self.remote_url(org)
         if remote_name is None:
             remote_name = org
         self._git(['remote', 'add', remote_name, url], check=check)
+
+    def meta_yaml(self, rev='HEAD'):
+        """ Text of recipe/meta.yaml at rev, None if it does not exist. """
+        content = self.read_blob(rev, 'recipe/meta.yaml')
+        if content is None:
+            return None
+        return content.decode('utf-8')
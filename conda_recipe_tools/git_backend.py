@@ -0,0 +1,418 @@
+""" In-process backends for read-only git operations.
+
+GitRepo uses these to answer rev-parse, config, ref listing and ls-files -m
+queries without starting a git process.  A backend raises BackendUnsupported
+for any repository layout or query it cannot answer exactly like git, in
+which case GitRepo falls back to running git.
+"""
+
+import hashlib
+import os
+import re
+import stat
+import struct
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+BACKEND_ENV_VAR = 'CRT_GIT_BACKEND'
+BACKENDS = ('auto', 'python', 'pygit2', 'subprocess')
+
+_HEX_SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+# ref names which are looked up, in order, for a short name like master
+_REF_RULES = (
+    '{}', 'refs/{}', 'refs/tags/{}', 'refs/heads/{}', 'refs/remotes/{}',
+    'refs/remotes/{}/HEAD')
+# characters which make a revision more than a plain ref name
+_REV_SPECIAL_RE = re.compile(r'[~^:@{}\s\\*?\[]|\.\.')
+# index extensions which do not change the entries listed in the index,
+# cache-tree, resolve-undo, untracked cache, fsmonitor and offset tables.
+# Any other extension, for example the split index (link) or sparse
+# directory entries (sdir), is not supported.
+_IGNORED_INDEX_EXTENSIONS = (
+    b'TREE', b'REUC', b'UNTR', b'FSMN', b'EOIE', b'IEOT')
+
+
+class BackendUnsupported(Exception):
+    pass
+
+
+def find_git_dirs(path):
+    """
+    Locate the git directory and common directory of a worktree.
+
+    Handles a ``.git`` directory, a ``.git`` file pointing elsewhere (as used
+    by submodules and linked worktrees) and a ``commondir`` file.
+
+    Returns
+    -------
+    git_dir, common_dir : str
+    """
+    dot_git = os.path.join(path, '.git')
+    if os.path.isdir(dot_git):
+        git_dir = dot_git
+    elif os.path.isfile(dot_git):
+        with open(dot_git) as f:
+            content = f.read().strip()
+        if not content.startswith('gitdir:'):
+            raise BackendUnsupported('invalid .git file in ' + path)
+        git_dir = os.path.join(path, content[len('gitdir:'):].strip())
+    else:
+        raise BackendUnsupported('not the top of a git worktree: ' + path)
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir_file):
+        with open(commondir_file) as f:
+            common_dir = os.path.join(git_dir, f.read().strip())
+    return os.path.normpath(git_dir), os.path.normpath(common_dir)
+
+
+def _parse_config_value(value):
+    out = []
+    in_quote = False
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c == '\\':
+            i += 1
+            if i == len(value):
+                raise BackendUnsupported('config line continuation')
+            escaped = value[i]
+            out.append({'n': '\n', 't': '\t', 'b': '\b'}.get(escaped, escaped))
+        elif c == '"':
+            in_quote = not in_quote
+        elif c in '#;' and not in_quote:
+            break
+        else:
+            out.append(c)
+        i += 1
+    if in_quote:
+        raise BackendUnsupported('unterminated quote in config value')
+    return ''.join(out).strip()
+
+
+def read_config(path):
+    """
+    Parse a git config file.
+
+    Returns a dictionary mapping normalized keys, for example
+    ``remote.origin.url``, to the list of their values.
+    """
+    section = None
+    config = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if line.startswith('['):
+                match = re.match(
+                    r'^\[\s*([\w.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]\s*'
+                    r'(?:[#;].*)?$', line)
+                if match is None:
+                    raise BackendUnsupported('config section: ' + line)
+                name, subsection = match.groups()
+                if subsection is not None:
+                    subsection = re.sub(r'\\(.)', r'\1', subsection)
+                    section = name.lower() + '.' + subsection
+                elif '.' in name:
+                    # deprecated [section.subsection] syntax
+                    name, subsection = name.split('.', 1)
+                    section = name.lower() + '.' + subsection.lower()
+                else:
+                    section = name.lower()
+                if section.split('.')[0] in ('include', 'includeif'):
+                    raise BackendUnsupported('config includes')
+                continue
+            if section is None or '=' not in line:
+                # values outside a section or implicit booleans
+                raise BackendUnsupported('config entry: ' + line)
+            key, value = line.split('=', 1)
+            key = section + '.' + key.strip().lower()
+            config.setdefault(key, []).append(_parse_config_value(value))
+    return config
+
+
+def _normalize_key(key):
+    parts = key.split('.')
+    if len(parts) < 2:
+        raise BackendUnsupported('invalid config key: ' + key)
+    # section and variable names are case insensitive, subsections are not
+    parts[0] = parts[0].lower()
+    parts[-1] = parts[-1].lower()
+    return '.'.join(parts)
+
+
+def _git_blob_hash(data):
+    header = 'blob {}\0'.format(len(data)).encode('ascii')
+    return hashlib.sha1(header + data).hexdigest()
+
+
+class PythonBackend(object):
+    """ Pure Python reader of the files in a git directory. """
+
+    name = 'python'
+
+    def __init__(self, path):
+        self._path = path
+        self._git_dir, self._common_dir = find_git_dirs(path)
+        if os.path.exists(os.path.join(self._common_dir, 'reftable')):
+            raise BackendUnsupported('reftable ref storage')
+        self._config = None
+        self._config_stat = None
+
+    @property
+    def config(self):
+        """ parsed repository config, re-read when the file changes """
+        path = os.path.join(self._common_dir, 'config')
+        st = os.stat(path)
+        config_stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if self._config is None or config_stat != self._config_stat:
+            self._config = read_config(path)
+            self._config_stat = config_stat
+        return self._config
+
+    def config_get(self, key):
+        """ Last value of key in the repository config file. """
+        if 'GIT_CONFIG_PARAMETERS' in os.environ or \
+                'GIT_CONFIG_COUNT' in os.environ:
+            raise BackendUnsupported('config set in the environment')
+        values = self.config.get(_normalize_key(key))
+        if not values:
+            # may be set in the global or system config
+            raise BackendUnsupported('key not in repository config: ' + key)
+        return values[-1]
+
+    def _ref_dir(self, refname):
+        if refname == 'HEAD' or refname.startswith(
+                ('refs/bisect/', 'refs/worktree/', 'refs/rewritten/')):
+            return self._git_dir
+        return self._common_dir
+
+    def _packed_refs(self):
+        refs = {}
+        path = os.path.join(self._common_dir, 'packed-refs')
+        if not os.path.exists(path):
+            return refs
+        with open(path) as f:
+            for line in f:
+                if line.startswith(('#', '^')):
+                    continue
+                sha, refname = line.split()
+                refs[refname] = sha
+        return refs
+
+    def _read_ref(self, refname, depth=0):
+        """ object hash of a ref, None if it does not exist """
+        if depth > 5:
+            raise BackendUnsupported('symbolic ref loop: ' + refname)
+        path = os.path.join(self._ref_dir(refname), refname)
+        if os.path.isfile(path):
+            with open(path) as f:
+                content = f.read().strip()
+            if content.startswith('ref:'):
+                return self._read_ref(content[4:].strip(), depth + 1)
+            if not _HEX_SHA_RE.match(content):
+                raise BackendUnsupported('invalid ref: ' + refname)
+            return content
+        if os.path.isdir(path):
+            return None
+        return self._packed_refs().get(refname)
+
+    def rev_parse(self, arg):
+        """ object hash of a full hash, HEAD or a ref name """
+        if _HEX_SHA_RE.match(arg):
+            return arg
+        if not arg or arg.startswith(('-', '/')) or \
+                _REV_SPECIAL_RE.search(arg):
+            raise BackendUnsupported('revision expression: ' + arg)
+        for rule in _REF_RULES:
+            if rule == '{}' and not (arg.isupper() or arg.startswith('refs/')):
+                # only pseudo refs like HEAD are looked up at the top level
+                continue
+            sha = self._read_ref(rule.format(arg))
+            if sha is not None:
+                return sha
+        # let git report the error
+        raise BackendUnsupported('unknown revision: ' + arg)
+
+    def list_refs(self, prefix='refs/'):
+        """ dictionary of ref names starting with prefix to object hashes """
+        names = set(self._packed_refs())
+        refs_dir = os.path.join(self._common_dir, 'refs')
+        for dirpath, dirnames, filenames in os.walk(refs_dir):
+            rel = os.path.relpath(dirpath, self._common_dir)
+            for filename in filenames:
+                names.add('/'.join(rel.split(os.sep) + [filename]))
+        refs = {}
+        for refname in sorted(names):
+            if not refname.startswith(prefix):
+                continue
+            sha = self._read_ref(refname)
+            if sha is not None:
+                refs[refname] = sha
+        return refs
+
+    def _index_entries(self):
+        with open(os.path.join(self._git_dir, 'index'), 'rb') as f:
+            data = f.read()
+        signature, version, count = struct.unpack('>4sII', data[:12])
+        if signature != b'DIRC' or version not in (2, 3):
+            raise BackendUnsupported('index version %d' % version)
+        pos = 12
+        entries = []
+        for _ in range(count):
+            fields = struct.unpack('>10I20sH', data[pos:pos + 62])
+            flags = fields[11]
+            header_len = 62
+            if flags & 0x4000:
+                # skip-worktree and intent-to-add entries
+                raise BackendUnsupported('extended index flags')
+            if flags & 0x3000:
+                raise BackendUnsupported('unmerged index entries')
+            name_end = data.index(b'\0', pos + header_len)
+            name = data[pos + header_len:name_end]
+            # entries are padded with 1-8 NUL bytes to a multiple of 8
+            entry_len = (header_len + len(name) + 8) & ~7
+            pos += entry_len
+            entries.append((name.decode('utf-8', 'surrogateescape'), fields))
+        # extensions follow the entries, the index ends with a SHA-1 checksum
+        end = len(data) - 20
+        while pos + 8 <= end:
+            signature, size = struct.unpack('>4sI', data[pos:pos + 8])
+            if signature not in _IGNORED_INDEX_EXTENSIONS:
+                raise BackendUnsupported('index extension %r' % signature)
+            pos += 8 + size
+        if pos != end:
+            raise BackendUnsupported('malformed index extensions')
+        return entries
+
+    def ls_files_modified(self):
+        """ paths of tracked files modified or deleted in the worktree """
+        if 'extensions.objectformat' in self.config:
+            raise BackendUnsupported('non SHA-1 object format')
+        index_mtime = os.stat(os.path.join(self._git_dir, 'index')).st_mtime
+        filemode = self.config.get('core.filemode', ['true'])[-1]
+        check_mode = filemode.lower() not in ('false', 'no', 'off', '0')
+        autocrlf = self.config.get('core.autocrlf', ['false'])[-1]
+        may_filter = autocrlf.lower() not in ('false', 'no', 'off', '0') or \
+            os.path.exists(os.path.join(self._git_dir, 'info', 'attributes'))
+        entries = self._index_entries()
+        if any(os.path.basename(n) == '.gitattributes' for n, _ in entries):
+            may_filter = True
+        modified = []
+        for name, fields in entries:
+            mtime_s, mtime_ns, ino, mode, size = (
+                fields[2], fields[3], fields[5], fields[6], fields[9])
+            sha = fields[10].hex()
+            if stat.S_IFMT(mode) == 0o160000:
+                raise BackendUnsupported('submodule entries')
+            try:
+                st = os.lstat(os.path.join(self._path, name))
+            except FileNotFoundError:
+                modified.append(name)
+                continue
+            if stat.S_IFMT(mode) == stat.S_IFLNK:
+                if not stat.S_ISLNK(st.st_mode):
+                    modified.append(name)
+                elif _git_blob_hash(os.fsencode(os.readlink(
+                        os.path.join(self._path, name)))) != sha:
+                    modified.append(name)
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                modified.append(name)
+                continue
+            if check_mode and bool(st.st_mode & 0o100) != bool(mode & 0o100):
+                modified.append(name)
+                continue
+            stat_clean = (
+                st.st_size == size and st.st_ino & 0xFFFFFFFF == ino and
+                int(st.st_mtime) == mtime_s and
+                st.st_mtime_ns % 1000000000 == mtime_ns and
+                st.st_mtime < index_mtime)
+            if stat_clean:
+                continue
+            with open(os.path.join(self._path, name), 'rb') as f:
+                if _git_blob_hash(f.read()) == sha:
+                    continue
+            if may_filter:
+                # the content may only differ because of clean filters
+                raise BackendUnsupported('attributes or autocrlf in use')
+            modified.append(name)
+        return modified
+
+
+class Pygit2Backend(object):
+    """ Backend using the libgit2 bindings from pygit2. """
+
+    name = 'pygit2'
+
+    def __init__(self, path):
+        if pygit2 is None:
+            raise BackendUnsupported('pygit2 is not installed')
+        try:
+            self._repo = pygit2.Repository(path)
+        except pygit2.GitError as exc:
+            raise BackendUnsupported(str(exc))
+
+    def config_get(self, key):
+        try:
+            return self._repo.config[key]
+        except KeyError:
+            raise BackendUnsupported('key not in config: ' + key)
+
+    def rev_parse(self, arg):
+        try:
+            return str(self._repo.revparse_single(arg).id)
+        except (KeyError, ValueError, pygit2.GitError):
+            raise BackendUnsupported('unknown revision: ' + arg)
+
+    def list_refs(self, prefix='refs/'):
+        refs = {}
+        for refname in self._repo.references:
+            if refname.startswith(prefix):
+                ref = self._repo.references[refname].resolve()
+                refs[refname] = str(ref.target)
+        return refs
+
+    def ls_files_modified(self):
+        flags = (pygit2.GIT_STATUS_WT_MODIFIED | pygit2.GIT_STATUS_WT_DELETED |
+                 pygit2.GIT_STATUS_WT_TYPECHANGE)
+        status = self._repo.status()
+        return sorted(path for path, flag in status.items() if flag & flags)
+
+
+def get_backend(path, name=None):
+    """
+    Return an in-process backend for the repository at path.
+
+    Parameters
+    ----------
+    path : str
+        Top directory of the worktree.
+    name : str or None
+        One of BACKENDS.  None uses the CRT_GIT_BACKEND environment variable,
+        defaulting to auto, which prefers pygit2 when it is installed.
+
+    Returns
+    -------
+    backend : PythonBackend, Pygit2Backend or None
+        None when the subprocess backend was selected or the repository
+        cannot be read in-process.
+    """
+    if name is None:
+        name = os.environ.get(BACKEND_ENV_VAR, 'auto')
+    if name not in BACKENDS:
+        raise ValueError('unknown git backend: ' + name)
+    if name == 'subprocess':
+        return None
+    if name == 'auto':
+        name = 'python' if pygit2 is None else 'pygit2'
+    try:
+        if name == 'pygit2':
+            return Pygit2Backend(path)
+        return PythonBackend(path)
+    except (BackendUnsupported, OSError):
+        return None
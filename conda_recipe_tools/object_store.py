@@ -0,0 +1,107 @@
+""" Shared git object store for feedstock clones.
+
+The store is a bare repository holding the objects of every feedstock
+fetched into it.  Feedstock clones borrow objects from the store through
+git alternates, so history shared between clones and remotes is stored and
+downloaded once.  Fetches in a clone only download objects missing from the
+store because git advertises the refs of alternates during negotiation.
+
+Objects in the store must outlive any clone which borrows them, so the store
+is configured to never prune unreachable objects.  For the same reason the
+store is kept in the user's data directory rather than a cache directory,
+as removing it would corrupt every clone which borrows from it.
+"""
+
+import logging
+import os
+
+from conda_recipe_tools.git import GitRepo
+
+CRT_DATA_DIR = os.path.join(
+    os.environ.get('XDG_DATA_HOME') or
+    os.path.join(os.path.expanduser('~'), '.local', 'share'),
+    'conda_recipe_tools')
+DEFAULT_STORE_PATH = os.path.join(CRT_DATA_DIR, 'feedstocks.git')
+# location of the store in earlier versions, inside the cache directory
+LEGACY_STORE_PATH = os.path.join(
+    os.path.expanduser('~'), '.cache', 'conda_recipe_tools', 'feedstocks.git')
+GITHUB_URL_TEMPLATE = 'https://github.com/{org}/{name}'
+
+
+class ObjectStore(GitRepo):
+    """
+    A bare repository of objects shared by feedstock clones.
+
+    Parameters
+    ----------
+    path : str
+        Path to the bare repository, created by init() if needed.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        super(ObjectStore, self).__init__(path)
+
+    @property
+    def objects_dir(self):
+        return os.path.join(self._path, 'objects')
+
+    def init(self):
+        """ create the store if it does not exist """
+        if not os.path.exists(os.path.join(self._path, 'HEAD')):
+            logging.info('creating object store: ' + self._path)
+            os.makedirs(self._path, exist_ok=True)
+            self._run(['git', 'init', '--bare', '-q', self._path])
+        # clones depend on objects in the store, never delete any of them
+        self._git(['config', 'gc.pruneExpire', 'never'])
+        self._git(['config', 'gc.auto', '0'])
+        return self
+
+    def fetch_feedstock(self, url, org, name):
+        """
+        Fetch the branches and tags of a feedstock into the store.
+
+        Refs are kept under refs/feedstocks/<org>/<name>/ and are only ever
+        added or updated, never removed.
+        """
+        prefix = 'refs/feedstocks/{}/{}'.format(org, name)
+        return self._git([
+            'fetch', '--quiet', '--no-tags', '--no-write-fetch-head', url,
+            '+refs/heads/*:{}/heads/*'.format(prefix),
+            '+refs/tags/*:{}/tags/*'.format(prefix)])
+
+    def gc(self):
+        """ repack the store, keeping unreachable objects """
+        return self._git(['gc', '--quiet', '--prune=never'])
+
+
+def bootstrap_feedstock(store, feedstock_path, orgs,
+                        url_template=GITHUB_URL_TEMPLATE, filter=None):
+    """
+    Fetch a feedstock into the store and make a clone borrow from it.
+
+    Parameters
+    ----------
+    store : ObjectStore
+        Initialized object store.
+    feedstock_path : str
+        Feedstock directory.  Existing clones and submodules are attached to
+        the store and repacked, missing ones are cloned from the first org.
+    orgs : list of str
+        Organizations whose feedstock repositories are fetched into the
+        store, the first is the origin of new clones.
+    url_template : str
+        Template for repository URLs with org and name fields.
+    filter : str or None
+        Partial clone filter used for new clones, for example blob:none.
+    """
+    name = os.path.basename(os.path.normpath(feedstock_path))
+    for org in orgs:
+        url = url_template.format(org=org, name=name)
+        store.fetch_feedstock(url, org, name)
+    repo = GitRepo(feedstock_path)
+    if os.path.exists(feedstock_path):
+        repo.add_alternate(store.objects_dir)
+    else:
+        url = url_template.format(org=orgs[0], name=name)
+        repo.clone(url, reference=store.path, filter=filter)
+    return repo
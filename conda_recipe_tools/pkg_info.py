@@ -2,20 +2,22 @@
 
 import csv
 
+from conda_recipe_tools.find_version import compile_extra, parse_extra_str
+
 
 def read_pkg_info(pkg_info_filename):
-    """ Read in package information from a CSV file. """
+    """ Read in package information from a CSV file.
+
+    Regular expressions in the update_extra column are compiled once here so
+    they are not recompiled for each version lookup.
+    """
     pkg_info = {}
     with open(pkg_info_filename) as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
             name = row['package_name']
             update_type = row['update_type']
-            extra_str = row['update_extra']
-            if extra_str == '' or not extra_str:
-                extra = {}
-            else:
-                extra = dict(s.split('=') for s in extra_str.split(';'))
+            extra = compile_extra(parse_extra_str(row['update_extra']))
             pkg_info[name] = {'update_type': update_type}
             pkg_info[name]['update_extra'] = extra
     return pkg_info
@@ -0,0 +1,177 @@
+""" Cache of project metadata from the PyPI JSON API. """
+
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from conda_recipe_tools.repodata import CRT_CACHE_DIR
+from conda_recipe_tools.util import write_json_atomic
+
+PYPI_PROJECT_URL = 'https://pypi.org/pypi/{project}/json'
+PYPI_RELEASE_URL = 'https://pypi.org/pypi/{project}/{version}/json'
+PYPI_CACHE_DIR = os.path.join(CRT_CACHE_DIR, 'pypi')
+# seconds for which cached metadata is used without contacting PyPI
+DEFAULT_MAX_AGE = 3600
+DEFAULT_TIMEOUT = 30
+
+
+def normalize_name(name):
+    """ Normalize a project name as described in PEP 503. """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+class PyPIMetadataCache(object):
+    """
+    Cache of PyPI project metadata shared by version, hash and requirement
+    lookups.
+
+    Project metadata is kept in memory and on disk.  Metadata younger than
+    max_age is used without contacting PyPI, older metadata is revalidated
+    with a conditional request.
+
+    Parameters
+    ----------
+    cache_dir : str or None
+        Directory where metadata is stored, None to only cache in memory.
+    max_age : float
+        Seconds for which metadata is used without contacting PyPI.
+    timeout : float
+        Timeout in seconds for requests to PyPI.
+
+    """
+
+    def __init__(self, cache_dir=PYPI_CACHE_DIR, max_age=DEFAULT_MAX_AGE,
+                 timeout=DEFAULT_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.timeout = timeout
+        self._entries = {}
+        self._locks = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks[key]
+
+    def _cache_path(self, key):
+        filename = re.sub(r'[^A-Za-z0-9._-]', '_', key) + '.json'
+        return os.path.join(self.cache_dir, filename)
+
+    def _read_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_path(key)) as fh:
+                return json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _fetch(self, key, url, get, max_age=None):
+        """ Return the payload for url, using and updating the cache.
+
+        max_age overrides the max_age of the cache for this request. """
+        if max_age is None:
+            max_age = self.max_age
+        with self._lock(key):
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._read_disk(key)
+            if (entry is not None and
+                    time.time() - entry['fetched_at'] < max_age):
+                self._entries[key] = entry
+                return entry['payload']
+
+            headers = {}
+            if entry is not None and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if get is None:
+                r = requests.get(url, headers=headers, timeout=self.timeout)
+            else:
+                r = get(url, headers=headers)
+            if r.status_code == 304:
+                entry['fetched_at'] = time.time()
+            elif r.status_code == 404:
+                entry = {'fetched_at': time.time(), 'payload': None}
+            else:
+                r.raise_for_status()
+                entry = {
+                    'fetched_at': time.time(),
+                    'etag': r.headers.get('ETag'),
+                    'payload': r.json(),
+                }
+            self._entries[key] = entry
+            if self.cache_dir is not None:
+                write_json_atomic(entry, self._cache_path(key))
+            return entry['payload']
+
+    def project(self, project, get=None):
+        """
+        Return the JSON metadata for a project, None if it does not exist.
+
+        get, when provided, is a callable used in place of requests.get,
+        for example LookupBudget.get.
+        """
+        key = normalize_name(project)
+        url = PYPI_PROJECT_URL.format(project=project)
+        return self._fetch(key, url, get)
+
+    def release(self, project, version, get=None, max_age=None):
+        """ Return the JSON metadata for a specific release of a project.
+
+        max_age overrides the max_age of the cache, 0 to always revalidate.
+        """
+        key = normalize_name(project) + '@' + str(version)
+        url = PYPI_RELEASE_URL.format(project=project, version=version)
+        return self._fetch(key, url, get, max_age)
+
+    def latest_version(self, project, get=None):
+        """ Return the latest version string of a project. """
+        payload = self.project(project, get)
+        if payload is None:
+            return None
+        return payload['info']['version']
+
+    def releases(self, project, get=None):
+        """ Return a list of all version strings of a project. """
+        payload = self.project(project, get)
+        if payload is None:
+            return []
+        return list(payload['releases'])
+
+    def digests(self, project, version, filename, get=None):
+        """ Return the digests of a release file, None if not found. """
+        payload = self.project(project, get)
+        if payload is not None:
+            for file_info in payload['releases'].get(str(version), []):
+                if file_info['filename'] == filename:
+                    return file_info['digests']
+        # the cached project metadata may predate the release, ask PyPI
+        payload = self.release(project, version, get, max_age=0)
+        if payload is None:
+            return None
+        for file_info in payload['urls']:
+            if file_info['filename'] == filename:
+                return file_info['digests']
+        return None
+
+    def requires_dist(self, project, version=None, get=None):
+        """ Return the requires_dist of a project, the latest when version
+        is None.  None is returned when the project or release does not
+        exist. """
+        payload = self.project(project, get)
+        if payload is None:
+            return None
+        if version is not None and str(version) != payload['info']['version']:
+            payload = self.release(project, version, get)
+            if payload is None:
+                return None
+        return payload['info']['requires_dist'] or []
+
+
+# cache shared by all lookups in a process
+PYPI_CACHE = PyPIMetadataCache()
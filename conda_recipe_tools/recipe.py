@@ -1,8 +1,12 @@
+import functools
 import hashlib
+import logging
 import os
 import re
+import threading
 
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import jinja2
 
@@ -10,11 +14,18 @@ import requests
 
 import yaml
 
+from conda_recipe_tools.pypi_metadata import PYPI_CACHE
+from conda_recipe_tools.source_cache import fetch_source, fetch_sources
+
 
 class CondaRecipe(object):
     """
     Representation of a conda recipe meta.yaml file.
 
+    The recipe is rendered and parsed the first time a property which needs
+    the parsed recipe is accessed, the result is cached until the text is
+    changed.
+
     Parameters
     ----------
     meta_filename : str
@@ -27,43 +38,115 @@ class CondaRecipe(object):
         # read the meta.yaml file for the recipe
         with open(meta_filename) as f:
             self.text = f.read()
-        self._render_and_parse()
+
+    @classmethod
+    def from_text(cls, text):
+        """ Create a CondaRecipe from the text of a meta.yaml file. """
+        recipe = cls.__new__(cls)
+        recipe.text = text
+        return recipe
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        self._rendered = None
+        self._parsed_cache = None
+
+    @property
+    def _parsed(self):
+        if self._parsed_cache is None:
+            self._render_and_parse()
+        return self._parsed_cache
 
     def _render_and_parse(self):
-        self._rendered = render_meta_yaml(self.text)
-        self._parsed = yaml.safe_load(self._rendered)
+        self._rendered = render_meta_yaml(self._text)
+        self._parsed_cache = yaml.safe_load(self._rendered)
 
-    def _apply_replacements(self, patterns):
-        for pattern, replacement in patterns:
-            self.text = re.sub(pattern, replacement, self.text)
-        self._render_and_parse()
+    def _quick_package_field(self, field):
+        """ Return a package field without rendering, None if not possible. """
+        if self._parsed_cache is not None:
+            return None
+        return _quick_package_field(self._text, field)
 
     def _check_replacement(self, attr, value):
         if str(getattr(self, attr)) != str(value):
             raise AttributeError("{} could not be set".format(attr))
 
-    def _replace_and_check(self, patterns, attr, value):
-        self._apply_replacements(patterns)
-        self._check_replacement(attr, value)
+    def update(self, version=None, hash_value=None, build_number=None):
+        """
+        Update one or more fields of the recipe in a single edit.
+
+        All substitutions are made in one pass over the text, after which the
+        recipe is rendered and checked once.  If any field cannot be set the
+        recipe is left unchanged.
+
+        Parameters
+        ----------
+        version : str or None
+            New version, None to leave unchanged.
+        hash_value : str or None
+            New value for the source hash, of the existing hash_type.  None to
+            leave unchanged.
+        build_number : int, str or None
+            New build number, None to leave unchanged.
+
+        Raises
+        ------
+        AttributeError
+            When a field could not be set.
+
+        """
+        values = {}
+        if version is not None:
+            values['version'] = str(version)
+        if hash_value is not None:
+            values['hash_value'] = str(hash_value)
+        if build_number is not None:
+            values['build_number'] = str(build_number)
+        if not values:
+            return
+        hash_type = None
+        if 'hash_value' in values:
+            hash_type = self.hash_type
+            if hash_type is None:
+                raise AttributeError("hash_value could not be set")
+        pattern, groups = _edit_pattern(tuple(sorted(values)), hash_type)
+
+        def replace(match):
+            field, replacement = groups[match.lastgroup]
+            return replacement.format(values[field])
+
+        original = (self._text, self._rendered, self._parsed_cache)
+        try:
+            self.text = pattern.sub(replace, self._text)
+            self._render_and_parse()
+            for attr, value in values.items():
+                self._check_replacement(attr, value)
+        except BaseException:
+            self._text, self._rendered, self._parsed_cache = original
+            raise
 
     @property
     def name(self):
+        name = self._quick_package_field('name')
+        if name is not None:
+            return name
         return self._parsed['package']['name']
 
     @property
     def version(self):
+        version = self._quick_package_field('version')
+        if version is not None:
+            return version
         return self._parsed['package']['version']
 
     @version.setter
     def version(self, version):
-        patterns = (
-            ('version:\s*[A-Za-z0-9._-]+',
-             'version: "{version}"'.format(version=version)),
-
-            ('{%\s*set\s+version\s*=\s*[^\s]*\s*%}',
-             '{{% set version = "{version}" %}}'.format(version=version)),
-        )
-        self._replace_and_check(patterns, 'version', version)
+        self.update(version=version)
 
     @property
     def hash_type(self):
@@ -97,21 +180,7 @@ class CondaRecipe(object):
     def hash_value(self, hash_value):
         if hash_value is None:
             raise ValueError("hash_value cannot be set to None")
-        hash_type = self.hash_type
-        # non-jinja sha256: abcd...  replacement
-        patterns = ((
-            '{}:\s*[0-9A-Fa-f]+'.format(hash_type),
-            '{}: {}'.format(hash_type, hash_value)),)
-        # jinja {% set blah = 'hash' %} replacements
-        checksum_names = [
-            'hash_value', 'hash', 'hash_val', 'sha256sum', 'checksum',
-            hash_type]
-        base1 = '''{{%\s*set {checkname} = ['"][0-9A-Fa-f]+['"] %}}'''
-        base2 = '{{% set {checkname} = "{h}" %}}'
-        for cn in checksum_names:
-            patterns += ((base1.format(checkname=cn),
-                          base2.format(checkname=cn, h=hash_value)),)
-        self._replace_and_check(patterns, 'hash_value', hash_value)
+        self.update(hash_value=hash_value)
 
     @property
     def build_number(self):
@@ -119,15 +188,14 @@ class CondaRecipe(object):
 
     @build_number.setter
     def build_number(self, build_number):
-        patterns = (
-            ('(?=\s*?)number:\s*([0-9]+)',
-             'number: {}'.format(build_number)),
-            ('(?=\s*?){%\s*set build_number\s*=\s*"?([0-9]+)"?\s*%}',
-             '{{% set build_number = {} %}}'.format(build_number)),
-            ('(?=\s*?){%\s*set build\s*=\s*"?([0-9]+)"?\s*%}',
-             '{{% set build = {} %}}'.format(build_number)),
-        )
-        self._replace_and_check(patterns, 'build_number', build_number)
+        self.update(build_number=build_number)
+
+    @property
+    def requirements(self):
+        """ Dictionary of the build, host and run requirements. """
+        requirements = self._parsed.get('requirements') or {}
+        return {section: requirements.get(section) or []
+                for section in ('build', 'host', 'run')}
 
     def __str__(self):
         props = ['name', 'version', 'hash_type', 'hash_value', 'url',
@@ -140,7 +208,120 @@ class CondaRecipe(object):
             f.write(self.text)
 
 
-def render_meta_yaml(text):
+# patterns used to find package fields without rendering the recipe
+_PACKAGE_SECTION_RE = re.compile(r'^package:[ \t]*\n((?:[ \t]+\S.*\n?)+)', re.M)
+_SET_RE = re.compile(r'{%-?\s*set\s+(\w+)\s*=')
+_SET_LITERAL_RE = re.compile(
+    r"""{%-?\s*set\s+(\w+)\s*=\s*(["'])([^"'{}%]*)\2\s*-?%}""")
+_FIRST_STATEMENT_RE = re.compile(r'{%-?\s*(?!set\b)\w')
+_JINJA_VAR_RE = re.compile(r'{{\s*(\w+)\s*(\|\s*lower\s*)?}}')
+
+
+def _quick_package_field(text, field):
+    """
+    Return the value of a field in the package section of a recipe without
+    rendering it.
+
+    This succeeds only for simple recipes where the field is a literal or
+    refers to variables set to string literals with {% set %} at the top of
+    the recipe.  None is returned for all other recipes.
+    """
+    sections = _PACKAGE_SECTION_RE.findall(text)
+    if len(sections) != 1:
+        return None
+    field_re = re.compile(r'^[ \t]+{}:(.*)$'.format(field), re.M)
+    lines = field_re.findall(sections[0])
+    if len(lines) != 1:
+        return None
+    value = lines[0].strip()
+    if '#' in value or '{%' in value:
+        return None
+
+    # variables must be set exactly once before any other jinja statement
+    first_statement = _FIRST_STATEMENT_RE.search(text)
+    end = len(text) if first_statement is None else first_statement.start()
+    set_counts = defaultdict(int)
+    for match in _SET_RE.finditer(text):
+        set_counts[match.group(1)] += 1
+    variables = {}
+    for match in _SET_LITERAL_RE.finditer(text):
+        name = match.group(1)
+        if match.start() < end and set_counts[name] == 1:
+            variables[name] = match.group(3)
+
+    def substitute(match):
+        var_value = variables.get(match.group(1))
+        if var_value is None:
+            raise KeyError(match.group(1))
+        if match.group(2):
+            return var_value.lower()
+        return var_value
+
+    try:
+        value = _JINJA_VAR_RE.sub(substitute, value)
+    except KeyError:
+        return None
+    if '{{' in value:
+        return None
+    try:
+        parsed = yaml.safe_load(value)
+    except yaml.YAMLError:
+        return None
+    if not isinstance(parsed, (str, int, float)):
+        return None
+    return parsed
+
+
+# (regex, replacement) pairs used to edit each field of a recipe.  The
+# replacements are format strings which are passed the new value.
+_VERSION_EDITS = (
+    (r'version:\s*[A-Za-z0-9._-]+', 'version: "{}"'),
+    (r'{%\s*set\s+version\s*=\s*[^\s]*\s*%}', '{{% set version = "{}" %}}'),
+)
+_BUILD_NUMBER_EDITS = (
+    (r'number:\s*[0-9]+', 'number: {}'),
+    (r'{%\s*set build_number\s*=\s*"?[0-9]+"?\s*%}',
+     '{{% set build_number = {} %}}'),
+    (r'{%\s*set build\s*=\s*"?[0-9]+"?\s*%}', '{{% set build = {} %}}'),
+)
+_CHECKSUM_NAMES = ('hash_value', 'hash', 'hash_val', 'sha256sum', 'checksum')
+
+
+def _hash_edits(hash_type):
+    # non-jinja sha256: abcd...  replacement
+    edits = [(r'{}:\s*[0-9A-Fa-f]+'.format(hash_type), hash_type + ': {}')]
+    # jinja {% set blah = 'hash' %} replacements
+    for name in _CHECKSUM_NAMES + (hash_type, ):
+        edits.append((
+            r'''{%\s*set ''' + name + r''' = ['"][0-9A-Fa-f]+['"] %}''',
+            '{{% set ' + name + ' = "{}" %}}'))
+    return edits
+
+
+@functools.lru_cache(maxsize=None)
+def _edit_pattern(fields, hash_type=None):
+    """
+    Return a compiled pattern which matches the edit locations of all fields
+    and a dictionary mapping group names to (field, replacement) tuples.
+    """
+    edits = []
+    for field in fields:
+        if field == 'version':
+            edits.extend((field, e) for e in _VERSION_EDITS)
+        elif field == 'build_number':
+            edits.extend((field, e) for e in _BUILD_NUMBER_EDITS)
+        elif field == 'hash_value':
+            edits.extend((field, e) for e in _hash_edits(hash_type))
+    alternatives = []
+    groups = {}
+    for i, (field, (regex, replacement)) in enumerate(edits):
+        group = 'e{}'.format(i)
+        alternatives.append('(?P<{}>{})'.format(group, regex))
+        groups[group] = (field, replacement)
+    return re.compile('|'.join(alternatives)), groups
+
+
+def render_meta_yaml(text, context=None):
     """
     Render the meta.yaml with Jinja2 variables.
 
@@ -148,14 +329,16 @@ def render_meta_yaml(text):
     ----------
     text : str
         The raw text in conda-forge feedstock meta.yaml file
+    context : dict or None
+        Additional variables available when rendering.
 
     Returns
     -------
     str
         The text of the meta.yaml with Jinja2 variables replaced.
     """
-    env = jinja2.Environment(undefined=_NullUndefined)
-    content = env.from_string(text).render(
+    content = _get_template(text).render(
+        context or {},
         os=os,
         environ=defaultdict(str),
         compiler=lambda x: x + "_compiler_stub",
@@ -166,6 +349,118 @@ def render_meta_yaml(text):
     return content
 
 
+class UndecidableRecipe(Exception):
+    pass
+
+
+# matches a line ending with a "# [selector]" comment
+_SELECTOR_RE = re.compile(r'^(.*?)\s*#\s*\[([^\[\]]+)\]\s*$')
+_JINJA_IF_RE = re.compile(r'{%-?\s*(?:if|elif)\s+(.+?)\s*-?%}')
+_IDENTIFIER_RE = re.compile(r'(?<![\w.])([A-Za-z_]\w*)')
+_JINJA_KEYWORDS = {
+    'and', 'or', 'not', 'in', 'is', 'true', 'false', 'none', 'True',
+    'False', 'None', 'defined', 'undefined', 'os', 'environ'}
+
+
+class _SelectorNamespace(dict):
+    def __missing__(self, key):
+        raise UndecidableRecipe('unknown selector variable: ' + key)
+
+
+def selector_namespace(subdir):
+    """ Return the selector variables for a subdir, e.g. linux-64. """
+    if subdir == 'noarch':
+        platform, arch = 'noarch', ''
+    else:
+        platform, arch = subdir.split('-', 1)
+    return {
+        'linux': platform == 'linux',
+        'linux32': subdir == 'linux-32',
+        'linux64': subdir == 'linux-64',
+        'osx': platform == 'osx',
+        'win': platform == 'win',
+        'win32': subdir == 'win-32',
+        'win64': subdir == 'win-64',
+        'unix': platform in ('linux', 'osx'),
+        'x86': arch in ('32', '64'),
+        'x86_64': arch == '64',
+        'ppc64le': arch == 'ppc64le',
+        'aarch64': arch == 'aarch64',
+        'arm64': arch == 'arm64',
+        's390x': arch == 's390x',
+        'armv7l': arch == 'armv7l',
+        'target_platform': subdir,
+        'build_platform': subdir,
+    }
+
+
+def apply_selectors(text, namespace, undecidable=None):
+    """
+    Remove lines from a meta.yaml whose # [selector] evaluates to False.
+
+    Selectors which use a variable not in namespace, for example py or a
+    variant specific variable, cannot be decided.  Lines with these selectors
+    are kept when undecidable is True and removed when it is False.  When
+    undecidable is None UndecidableRecipe is raised instead.
+    """
+    namespace = _SelectorNamespace(namespace)
+    lines = []
+    for line in text.splitlines():
+        match = _SELECTOR_RE.match(line)
+        if match is None:
+            lines.append(line)
+            continue
+        try:
+            keep = eval(match.group(2), {'__builtins__': {}}, namespace)
+        except Exception as exc:
+            if undecidable is None:
+                if isinstance(exc, UndecidableRecipe):
+                    raise
+                raise UndecidableRecipe(
+                    'cannot evaluate selector: {} ({})'.format(
+                        match.group(2), exc))
+            keep = undecidable
+        if keep:
+            lines.append(match.group(1))
+    return '\n'.join(lines) + '\n'
+
+
+def render_for_subdir(text, subdir, undecidable=None):
+    """
+    Render and parse a meta.yaml for a target subdir without conda-build.
+
+    Selectors are applied for the subdir before the Jinja2 template is
+    rendered with the selector variables available.  undecidable is passed
+    to apply_selectors.  Rendering with both True and False shows whether
+    the undecidable selectors matter for a given field.
+
+    Returns
+    -------
+    parsed : dict
+        The parsed recipe.
+
+    Raises
+    ------
+    UndecidableRecipe
+        When the recipe depends on variables other than the platform, for
+        example the Python version, and so cannot be rendered reliably
+        without conda-build.
+
+    """
+    namespace = selector_namespace(subdir)
+    selected = apply_selectors(text, namespace, undecidable)
+    known = set(namespace) | set(_SET_RE.findall(selected)) | _JINJA_KEYWORDS
+    for condition in _JINJA_IF_RE.findall(selected):
+        for name in _IDENTIFIER_RE.findall(condition):
+            if name not in known:
+                raise UndecidableRecipe(
+                    'unknown jinja variable in condition: ' + name)
+    try:
+        return yaml.safe_load(render_meta_yaml(selected, namespace))
+    except Exception as exc:
+        raise UndecidableRecipe('cannot render recipe: {}'.format(exc))
+
+
 class _NullUndefined(jinja2.Undefined):
     def __unicode__(self):
         return self._undefined_name
@@ -177,25 +472,120 @@ class _NullUndefined(jinja2.Undefined):
         return '{}["{}"]'.format(self, name)
 
 
-def find_hash(recipe):
+# a single environment is shared by all renders, compiled templates are kept
+# in a bounded LRU cache keyed by a hash of the template text.  Compiling
+# takes almost all of the render time, the cache pays off when the same text
+# is rendered again, for example when render_for_subdir selects identical
+# text for several subdirs.  CondaRecipe keeps its own parsed result and each
+# edit changes the text, so its renders do not hit the cache.
+_JINJA_ENV = jinja2.Environment(undefined=_NullUndefined)
+_TEMPLATE_CACHE_SIZE = 256
+_template_cache = OrderedDict()
+_template_cache_lock = threading.Lock()
+
+
+def _get_template(text):
+    """ Return a compiled Jinja2 template for text, using the cache. """
+    key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    with _template_cache_lock:
+        template = _template_cache.get(key)
+        if template is not None:
+            _template_cache.move_to_end(key)
+            return template
+    template = _JINJA_ENV.from_string(text)
+    with _template_cache_lock:
+        _template_cache[key] = template
+        while len(_template_cache) > _TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+    return template
+
+
+def find_hash(recipe, use_cache=True):
+    """
+    Determine the hash of the source for a recipe.
+
+    Hashes of PyPI sources are taken from the PyPI JSON API, all other
+    sources are downloaded.  When use_cache is True downloads go through the
+    source cache in conda_recipe_tools.source_cache and are reused by later
+    calls.
+    """
     if recipe.url.startswith('https://pypi.io'):
         project, filename = recipe.url.split('/')[-2:]
         return _find_hash_pypi(
             project, recipe.version, filename, recipe.hash_type)
+    elif use_cache:
+        return fetch_source(recipe.url)[recipe.hash_type]
     else:
         hasher = getattr(hashlib, recipe.hash_type)()
-        r = requests.get(recipe.url)
+        r = requests.get(recipe.url, stream=True)
         for chunk in r.iter_content(chunk_size=1024 * 512):
             hasher.update(chunk)
         return hasher.hexdigest()
 
 
+def find_hashes(recipes, max_workers=8, max_per_host=2):
+    """
+    Determine the source hashes for a number of recipes concurrently.
+
+    Non-PyPI sources are downloaded through the source cache using at most
+    max_workers concurrent downloads and max_per_host downloads from any one
+    host.  Interrupted downloads are resumed.
+
+    Returns
+    -------
+    hashes : list
+        Hash value for each recipe, None when it could not be determined.
+
+    """
+    recipes = list(recipes)
+
+    def source_url(recipe):
+        try:
+            return recipe.url
+        except Exception as exc:
+            logging.warning('cannot determine source url: {}'.format(exc))
+            return None
+
+    urls = [source_url(r) for r in recipes]
+    is_pypi = [url is not None and url.startswith('https://pypi.io')
+               for url in urls]
+    records = fetch_sources(
+        [url for url, pypi in zip(urls, is_pypi)
+         if url is not None and not pypi],
+        max_workers=max_workers, max_per_host=max_per_host)
+
+    def pypi_hash(recipe):
+        try:
+            return find_hash(recipe)
+        except Exception as exc:
+            logging.warning('hash lookup failed for {}: {}'.format(
+                recipe.url, exc))
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pypi_hashes = executor.map(
+            pypi_hash, [r for r, pypi in zip(recipes, is_pypi) if pypi])
+        pypi_hashes = list(pypi_hashes)
+    hashes = []
+    for recipe, url, pypi in zip(recipes, urls, is_pypi):
+        if pypi:
+            hashes.append(pypi_hashes.pop(0))
+            continue
+        # a failure only affects the hash of this recipe
+        try:
+            record = records[url]
+            if isinstance(record, Exception):
+                raise record
+            hashes.append(record[recipe.hash_type])
+        except Exception as exc:
+            logging.warning('hash lookup failed for {}: {!r}'.format(
+                url, exc))
+            hashes.append(None)
+    return hashes
+
+
 def _find_hash_pypi(project, version, filename, hash_type):
-    url = 'https://pypi.org/pypi/{}/{}/json'.format(project, version)
-    r = requests.get(url)
-    payload = r.json()
-    release = payload['releases'][str(version)]
-    for file_info in release:
-        if file_info['filename'] == filename:
-            return file_info['digests'][hash_type]
-    return None
+    digests = PYPI_CACHE.digests(project, version, filename)
+    if digests is None:
+        return None
+    return digests[hash_type]
@@ -0,0 +1,119 @@
+""" Persistent index of recipe metadata for a collection of feedstocks. """
+
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from conda_recipe_tools.recipe import CondaRecipe
+from conda_recipe_tools.repodata import CRT_CACHE_DIR
+from conda_recipe_tools.util import write_json_atomic
+
+DEFAULT_INDEX_PATH = os.path.join(CRT_CACHE_DIR, 'recipe_index.json')
+RECIPE_PATTERN = os.path.join('*', 'recipe', 'meta.yaml')
+
+
+def find_recipe_paths(base_dir='.', pattern=RECIPE_PATTERN):
+    """ Return a sorted list of recipe paths under base_dir. """
+    return sorted(glob.glob(os.path.join(base_dir, pattern)))
+
+
+def read_index(path=DEFAULT_INDEX_PATH):
+    """
+    Read a recipe index.
+
+    Returns
+    -------
+    index : dict
+        Dictionary mapping absolute recipe paths to dictionaries with the
+        sha256 of the recipe text and the extracted metadata.  An empty
+        dictionary is returned if the index does not exist or cannot be read.
+
+    """
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_index(index, path=DEFAULT_INDEX_PATH):
+    """ Atomically write a recipe index. """
+    write_json_atomic(index, path, sort_keys=True)
+
+
+def recipe_metadata(text):
+    """
+    Extract metadata from the text of a recipe.
+
+    Returns
+    -------
+    metadata : dict
+        Dictionary with name, version, url, hash_type, hash_value,
+        build_number and requirements keys.  When the recipe cannot be
+        rendered or parsed the dictionary contains only an error key.
+
+    """
+    recipe = CondaRecipe.from_text(text)
+    try:
+        return {
+            'name': recipe.name,
+            'version': str(recipe.version),
+            'url': recipe.url,
+            'hash_type': recipe.hash_type,
+            'hash_value': recipe.hash_value,
+            'build_number': recipe.build_number,
+            'requirements': recipe.requirements,
+        }
+    except Exception as exc:
+        return {'error': '{}: {}'.format(type(exc).__name__, exc)}
+
+
+def scan_recipes(paths, index=None, max_workers=None):
+    """
+    Return metadata for a number of recipes, re-using an index.
+
+    Recipes whose text has not changed since they were indexed are not
+    parsed again, all others are parsed in a process pool.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths to the meta.yaml files to scan.
+    index : dict or None
+        Index from read_index, updated in place with the scanned recipes.
+    max_workers : int or None
+        Maximum number of processes used to parse recipes, None for the
+        number of processors on the machine.
+
+    Returns
+    -------
+    metadata : dict
+        Dictionary mapping each path to the metadata of the recipe, see
+        recipe_metadata.
+
+    """
+    if index is None:
+        index = {}
+    results = {}
+    to_parse = []
+    for path in paths:
+        key = os.path.abspath(path)
+        with open(path, 'rb') as fh:
+            raw = fh.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        entry = index.get(key)
+        if entry is not None and entry.get('sha256') == digest:
+            results[path] = entry['metadata']
+        else:
+            to_parse.append((path, key, digest, raw.decode('utf-8', errors='replace')))
+
+    if to_parse:
+        texts = [text for _, _, _, text in to_parse]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed = executor.map(recipe_metadata, texts, chunksize=16)
+            for (path, key, digest, _), metadata in zip(to_parse, parsed):
+                index[key] = {'sha256': digest, 'metadata': metadata}
+                results[path] = metadata
+    return results
@@ -123,7 +123,7 @@ def newest_version_for_channel(channel, subdirs=None):
     """
     if subdirs is None:
         subdirs = ['linux-64', 'win-32', 'win-64', 'osx-64', 'linux-ppc64le', 'noarch']
-    newest_by_subdir = {s: newest_version_for_subdir(channel, s) for s in subdirs}
+    newest_by_subdir = {}
     newest_for_channel = {}
     for subdir in subdirs:
         newest = newest_version_for_subdir(channel, subdir)
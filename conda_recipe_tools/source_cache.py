@@ -0,0 +1,436 @@
+""" Content-addressed cache of downloaded source archives. """
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+
+from conda_recipe_tools.repodata import CRT_CACHE_DIR
+from conda_recipe_tools.util import write_json_atomic
+
+SOURCE_CACHE_DIR = os.path.join(CRT_CACHE_DIR, 'sources')
+HASH_TYPES = ('md5', 'sha1', 'sha256')
+CHUNK_SIZE = 1024 * 512
+# (connect, read) timeout in seconds for source downloads
+DOWNLOAD_TIMEOUT = (30, 300)
+# seconds after a download or revalidation before a URL is revalidated
+REVALIDATE_AFTER = 3600
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _record_path(url, cache_dir):
+    return os.path.join(cache_dir, 'urls', _url_key(url) + '.json')
+
+
+def _object_path(sha256, cache_dir):
+    return os.path.join(cache_dir, 'by-sha256', sha256)
+
+
+def _partial_path(url, cache_dir):
+    return os.path.join(cache_dir, 'partial', _url_key(url) + '.part')
+
+
+def cached_digests(url, cache_dir=SOURCE_CACHE_DIR):
+    """
+    Return the digests of a previously downloaded source.
+
+    Returns
+    -------
+    record : dict or None
+        Dictionary with url, size, md5, sha1 and sha256 keys and a path key
+        giving the location of the cached archive, None if the archive was
+        not kept.  The etag and last_modified keys hold the validators sent
+        by the server, if any, and checked_at the time the content was last
+        downloaded or revalidated.  None is returned when the URL has not
+        been downloaded.
+
+    """
+    try:
+        with open(_record_path(url, cache_dir)) as fh:
+            record = json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    path = _object_path(record['sha256'], cache_dir)
+    record['path'] = path if os.path.exists(path) else None
+    return record
+
+
+def fetch_source(url, cache_dir=SOURCE_CACHE_DIR, keep=True, retries=3,
+                 revalidate=True):
+    """
+    Download a source archive, computing its md5, sha1 and sha256 digests.
+
+    The digests are computed in the same pass as the download.  Archives
+    are stored under their sha256 digest and indexed by URL, so identical
+    archives are stored once.  A URL downloaded before is revalidated with
+    the ETag or Last-Modified validators sent by the server and only
+    downloaded again when the content has changed, for example when a
+    release is re-tagged.  Interrupted downloads are resumed with a HTTP
+    Range request when the server supports it, either on a retry or by a
+    later call.
+
+    Parameters
+    ----------
+    url : str
+        URL of the source archive.
+    cache_dir : str
+        Directory of the source cache.
+    keep : bool
+        True to keep the archive in the cache, False to keep only the digests.
+    retries : int
+        Number of times an interrupted download is resumed before giving up.
+        Only connection errors, timeouts and server errors are retried.
+    revalidate : bool
+        True to revalidate a cached URL last checked more than
+        REVALIDATE_AFTER seconds ago, False to always use a cached record.
+
+    Returns
+    -------
+    record : dict
+        See cached_digests.
+
+    """
+    started = time.time()
+    record = cached_digests(url, cache_dir)
+    if _usable(record, keep) and (
+            not revalidate or _revalidate(record, cache_dir)):
+        _touch(record['path'])
+        return record
+
+    partial_path = _partial_path(url, cache_dir)
+    os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+    with _partial_lock(partial_path):
+        # another thread or process may have completed the download while
+        # waiting
+        record = cached_digests(url, cache_dir)
+        if _usable(record, keep) and record.get('checked_at', 0) >= started:
+            return record
+        for attempt in range(retries + 1):
+            try:
+                hashers, size, validators = _download(url, partial_path)
+                break
+            except requests.RequestException as exc:
+                if attempt == retries or not _is_retryable(exc):
+                    raise
+                logging.info('download interrupted, resuming: ' + url)
+        return _store(
+            url, partial_path, hashers, size, validators, cache_dir, keep)
+
+
+def _usable(record, keep):
+    return record is not None and (record['path'] is not None or not keep)
+
+
+def _revalidate(record, cache_dir):
+    """
+    True if the content of a cached URL has not changed.
+
+    Records checked within REVALIDATE_AFTER seconds are not revalidated.
+    Records without validators, and those which cannot be revalidated, are
+    treated as changed.
+    """
+    if time.time() - record.get('checked_at', 0) < REVALIDATE_AFTER:
+        return True
+    etag, last_modified = record.get('etag'), record.get('last_modified')
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    if not headers:
+        return False
+    try:
+        r = requests.head(record['url'], headers=headers, allow_redirects=True,
+                          timeout=DOWNLOAD_TIMEOUT)
+    except requests.RequestException as exc:
+        logging.info('cannot revalidate {}: {}'.format(record['url'], exc))
+        return False
+    if r.status_code == 304:
+        unchanged = True
+    elif r.ok and etag:
+        unchanged = r.headers.get('ETag') == etag
+    elif r.ok:
+        unchanged = r.headers.get('Last-Modified') == last_modified
+    else:
+        unchanged = False
+    if unchanged:
+        record['checked_at'] = time.time()
+        write_json_atomic(
+            {k: v for k, v in record.items() if k != 'path'},
+            _record_path(record['url'], cache_dir))
+    return unchanged
+
+
+def _is_retryable(exc):
+    """ True for connection problems and server errors, not client errors. """
+    if isinstance(exc, requests.HTTPError):
+        response = exc.response
+        return response is not None and response.status_code >= 500
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout,
+                            requests.exceptions.ChunkedEncodingError))
+
+
+def _touch(path):
+    """ Mark a cached archive as used so prune_sources keeps it. """
+    if path is None:
+        return
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+_partial_locks = defaultdict(threading.Lock)
+_partial_locks_lock = threading.Lock()
+
+
+@contextmanager
+def _partial_lock(partial_path):
+    """
+    Lock which prevents two threads or processes writing the same partial
+    file.  Processes sharing the cache coordinate through an flock on a lock
+    file next to the partial file.
+    """
+    with _partial_locks_lock:
+        thread_lock = _partial_locks[partial_path]
+    with thread_lock:
+        lock_file = _flock(partial_path + '.lock', blocking=True)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+def _flock(lock_path, blocking):
+    """
+    Open and exclusively lock a lock file, None if blocking is False and the
+    file is locked by another process.
+
+    prune_sources removes lock files while holding the lock, so the lock is
+    retried when the file locked is no longer the one at lock_path.
+    """
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    while True:
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, flags)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        try:
+            same = os.stat(lock_path).st_ino == os.fstat(
+                lock_file.fileno()).st_ino
+        except FileNotFoundError:
+            same = False
+        if same:
+            return lock_file
+        lock_file.close()
+
+
+def _download(url, partial_path):
+    """ Download url to partial_path, resuming from any existing content. """
+    hashers = {hash_type: hashlib.new(hash_type) for hash_type in HASH_TYPES}
+    size = 0
+    if os.path.exists(partial_path):
+        with open(partial_path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+                size += len(chunk)
+    headers = {'Range': 'bytes={}-'.format(size)} if size else {}
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT,
+                      headers=headers) as r:
+        validators = {
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+        }
+        if r.status_code == 416:
+            # the partial file is not a prefix of the current content
+            os.unlink(partial_path)
+            return _download(url, partial_path)
+        r.raise_for_status()
+        if r.status_code != 206:
+            # the server ignored the range request, start over
+            hashers = {
+                hash_type: hashlib.new(hash_type) for hash_type in HASH_TYPES}
+            size = 0
+        mode = 'ab' if r.status_code == 206 else 'wb'
+        with open(partial_path, mode) as fh:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+                fh.write(chunk)
+                size += len(chunk)
+    return hashers, size, validators
+
+
+def _store(url, partial_path, hashers, size, validators, cache_dir, keep):
+    """ Move a completed download into the cache and record its digests. """
+    record = {'url': url, 'size': size, 'checked_at': time.time()}
+    record.update(validators)
+    for hash_type, hasher in hashers.items():
+        record[hash_type] = hasher.hexdigest()
+    path = _object_path(record['sha256'], cache_dir)
+    if keep:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(partial_path, path)
+    else:
+        os.unlink(partial_path)
+    write_json_atomic(record, _record_path(url, cache_dir))
+    record['path'] = path if os.path.exists(path) else None
+    return record
+
+
+def prune_sources(cache_dir=SOURCE_CACHE_DIR, max_age=None, max_bytes=None):
+    """
+    Remove archives from the source cache.
+
+    Only the archives are removed, the recorded digests of their URLs are
+    kept so hashes can still be looked up without a download.  Stale partial
+    downloads and the lock files of completed downloads are removed as well.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the source cache.
+    max_age : float or None
+        Remove archives and partial downloads not used in this many seconds.
+    max_bytes : int or None
+        Remove the least recently used archives until the archives remaining
+        take up at most this many bytes.
+
+    Returns
+    -------
+    removed : int
+        Number of files removed.
+    freed : int
+        Number of bytes freed.
+
+    """
+    now = time.time()
+    removed = 0
+    freed = 0
+
+    def remove(path, size):
+        nonlocal removed, freed
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        removed += 1
+        freed += size
+
+    objects = []
+    objects_dir = os.path.join(cache_dir, 'by-sha256')
+    if os.path.isdir(objects_dir):
+        for entry in os.scandir(objects_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                objects.append((stat.st_mtime, stat.st_size, entry.path))
+    objects.sort()
+    if max_age is not None:
+        expired = [obj for obj in objects if now - obj[0] > max_age]
+        objects = objects[len(expired):]
+        for mtime, size, path in expired:
+            remove(path, size)
+    if max_bytes is not None:
+        total = sum(size for mtime, size, path in objects)
+        for mtime, size, path in objects:
+            if total <= max_bytes:
+                break
+            remove(path, size)
+            total -= size
+
+    partial_dir = os.path.join(cache_dir, 'partial')
+    if not os.path.isdir(partial_dir):
+        return removed, freed
+    stale = set()
+    for entry in os.scandir(partial_dir):
+        if entry.name.endswith('.part'):
+            if max_age is not None and now - entry.stat().st_mtime > max_age:
+                stale.add(entry.path)
+        elif entry.name.endswith('.part.lock'):
+            # lock files left after their download completed
+            part_path = entry.path[:-len('.lock')]
+            if not os.path.exists(part_path):
+                stale.add(part_path)
+    for part_path in sorted(stale):
+        # skip partial files which are still being downloaded, the lock file
+        # is removed while locked so that waiting processes lock a new one
+        lock_file = _flock(part_path + '.lock', blocking=False)
+        if lock_file is None:
+            continue
+        try:
+            if os.path.exists(part_path):
+                remove(part_path, os.stat(part_path).st_size)
+            remove(part_path + '.lock', 0)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+    return removed, freed
+
+
+def fetch_sources(urls, cache_dir=SOURCE_CACHE_DIR, keep=True, max_workers=8,
+                  max_per_host=2, retries=3, revalidate=True):
+    """
+    Download a number of source archives concurrently.
+
+    Parameters
+    ----------
+    urls : list of str
+        URLs of the source archives, duplicates are only downloaded once.
+    cache_dir, keep, retries, revalidate
+        See fetch_source.
+    max_workers : int
+        Maximum number of concurrent downloads.
+    max_per_host : int
+        Maximum number of concurrent downloads from any single host.
+
+    Returns
+    -------
+    records : dict
+        Dictionary mapping each URL to the record returned by fetch_source,
+        or to the exception raised if the download failed.
+
+    """
+    urls = list(dict.fromkeys(urls))
+    host_limits = defaultdict(lambda: threading.BoundedSemaphore(max_per_host))
+    host_limits_lock = threading.Lock()
+    progress = {'done': 0}
+    progress_lock = threading.Lock()
+
+    def fetch(url):
+        with host_limits_lock:
+            host_limit = host_limits[urlparse(url).netloc]
+        with host_limit:
+            try:
+                result = fetch_source(
+                    url, cache_dir, keep, retries, revalidate)
+            except Exception as exc:
+                result = exc
+        with progress_lock:
+            progress['done'] += 1
+            done = progress['done']
+        if isinstance(result, Exception):
+            logging.warning('[{}/{}] download failed: {} ({})'.format(
+                done, len(urls), url, result))
+        else:
+            logging.info('[{}/{}] downloaded: {} ({} bytes)'.format(
+                done, len(urls), url, result['size']))
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(urls, executor.map(fetch, urls)))
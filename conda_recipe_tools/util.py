@@ -1,5 +1,10 @@
 """ Utility functions. """
 
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
 
 def get_feedstock_dirs(feedstock_dirs, feedstock_file):
     """ Return a list of feedstock directories to examine. """
@@ -10,3 +15,29 @@ def get_feedstock_dirs(feedstock_dirs, feedstock_file):
     with open(feedstock_file) as f:
         feedstock_dirs = [l.strip() for l in f if is_valid(l)]
     return feedstock_dirs
+
+
+@contextmanager
+def open_atomic(path, mode='w'):
+    """
+    Open a temporary file which replaces path when the block completes.
+
+    If the block raises, the temporary file is removed and any existing file
+    at path is left unchanged.
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as fh:
+            yield fh
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_json_atomic(obj, path, **kwargs):
+    """ Write obj to a JSON file, replacing any existing file atomically. """
+    with open_atomic(path) as fh:
+        json.dump(obj, fh, **kwargs)
@@ -0,0 +1,110 @@
+""" Persistent store of latest version lookup results. """
+
+import json
+import os
+import time
+
+from conda_recipe_tools.find_version import (
+    DEFAULT_CACHE_TTL, LookupBudget, NotModified, find_latest_version,
+    get_source)
+from conda_recipe_tools.repodata import CRT_CACHE_DIR
+from conda_recipe_tools.util import write_json_atomic
+
+DEFAULT_STORE_PATH = os.path.join(CRT_CACHE_DIR, 'latest_versions.json')
+
+
+def read_store(path=DEFAULT_STORE_PATH):
+    """
+    Read a store of version lookup results.
+
+    Parameters
+    ----------
+    path : str
+        Path to the store file.
+
+    Returns
+    -------
+    store : dict
+        Dictionary mapping package names to entries.  Each entry is a dict
+        with source, latest_version, checked_at and validators keys.  An
+        empty dictionary is returned if the store does not exist or cannot
+        be read.
+
+    """
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_store(store, path=DEFAULT_STORE_PATH):
+    """ Atomically write a store of version lookup results. """
+    write_json_atomic(store, path, indent=1, sort_keys=True)
+
+
+def is_stale(entry, name, update_type, max_age=None, now=None):
+    """
+    Determine if a stored entry needs to be looked up again.
+
+    Parameters
+    ----------
+    entry : dict or None
+        Entry from the store, None if the package is not in the store.
+    name : str
+        Name of the package.
+    update_type : str
+        How the latest version of the package is determined.
+    max_age : float or None
+        Maximum age in seconds of a valid entry.  None will use the cache_ttl
+        of the version source, or DEFAULT_CACHE_TTL for sources without one.
+    now : float or None
+        Current time, None for time.time().
+
+    """
+    if entry is None or entry.get('source') != update_type:
+        return True
+    if entry.get('latest_version') in (None, 'None'):
+        # failed lookups are never served from the store, 'None' was
+        # stored by earlier versions
+        return True
+    if max_age is None:
+        source = get_source(name, update_type)
+        if source is None:
+            return True
+        max_age = source.cache_ttl
+        if max_age is None:
+            max_age = DEFAULT_CACHE_TTL
+    if now is None:
+        now = time.time()
+    return now - entry.get('checked_at', 0) > max_age
+
+
+def lookup_entry(name, update_type, extra, entry=None, budget=None):
+    """
+    Look up the latest version of a package and return a new store entry.
+
+    Validators from a previous entry for the same source are used to make
+    conditional requests, when the upstream has not changed the previous
+    version is kept.  The latest_version of the entry is None when the
+    version could not be determined, such entries should not be stored.
+    """
+    if budget is None:
+        budget = LookupBudget()
+    if entry is not None and entry.get('source') == update_type:
+        conditional = budget.conditional(entry.get('validators'))
+    else:
+        entry = None
+        conditional = budget.conditional()
+    try:
+        version = find_latest_version(
+            name, update_type, extra, budget=conditional)
+        latest_version = None if version is None else str(version)
+    except NotModified:
+        latest_version = entry['latest_version']
+    return {
+        'source': update_type,
+        'latest_version': latest_version,
+        'checked_at': time.time(),
+        'validators': conditional.validators,
+    }
@@ -32,6 +32,7 @@ setup(
         'console_scripts': [
             'channel_newest=conda_recipe_tools.cli.channel_newest:main',
             'create_clobber=conda_recipe_tools.cli.create_clobber:main',
+            'crt=conda_recipe_tools.cli.crt:main',
             'create_diff_report=conda_recipe_tools.cli.create_diff_report:main',
             'extract_index_json=conda_recipe_tools.cli.extract_index_json:main',
             'find_changed_feedstocks=conda_recipe_tools.cli.find_changed_feedstocks:main',
@@ -45,6 +46,7 @@ setup(
             'rebuild_what=conda_recipe_tools.cli.rebuild_what:main',
             'reqs=conda_recipe_tools.cli.reqs:main',
             'run_grimlock=conda_recipe_tools.cli.run_grimlock:main',
+            'scan_recipes=conda_recipe_tools.cli.scan_recipes:main',
             'show_git_messages=conda_recipe_tools.cli.show_git_messages:main',
             'sync_cf=conda_recipe_tools.cli.sync_cf:main',
             'update_recipe=conda_recipe_tools.cli.update_recipe:main',
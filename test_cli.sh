@@ -3,6 +3,7 @@
 set -e
 
 create_clobber --help
+crt --help
 extract_index_json --help
 find_latest --help
 find_outdated_packages_pypi --help
@@ -13,6 +14,7 @@ pypi --help
 replace_index_json --help
 reqs --help
 run_grimlock --help
+scan_recipes --help
 show_git_messages --help
 sync_cf --help
 update_recipe --help
@@ -0,0 +1,68 @@
+""" Tests of version sources and link extraction. """
+
+import os
+
+import pytest
+
+from conda_recipe_tools.find_version import (
+    _MAX_ANCHOR_TAIL, LookupBudget, VersionSource, _iter_anchors)
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'benchmarks', 'fixtures', 'index_pages')
+
+
+def test_source_receives_budget():
+    calls = []
+
+    def func(name, extra, budget):
+        calls.append(budget)
+        return '1.0'
+
+    budget = LookupBudget()
+    assert VersionSource('test', func).find('foo', {}, budget) == '1.0'
+    assert calls == [budget]
+
+
+def test_two_argument_source_still_works():
+    def func(name, extra):
+        return extra['version']
+
+    source = VersionSource('test', func)
+    assert source.find('foo', {'version': '2.0'}, LookupBudget()) == '2.0'
+
+
+def test_source_with_optional_budget():
+    def func(name, extra, budget=None):
+        return budget
+
+    budget = LookupBudget()
+    assert VersionSource('test', func).find('foo', {}, budget) is budget
+
+
+def _anchors(page, chunk_size):
+    chunks = [page[i:i + chunk_size] for i in range(0, len(page), chunk_size)]
+    return list(_iter_anchors(chunks))
+
+
+@pytest.mark.parametrize('filename', sorted(os.listdir(FIXTURE_DIR)))
+def test_anchors_do_not_depend_on_chunk_size(filename):
+    with open(os.path.join(FIXTURE_DIR, filename), 'rb') as f:
+        page = f.read()
+    expected = _anchors(page, len(page))
+    assert expected
+    for chunk_size in [1, 2, 3, 7, 100, 4096, 65536]:
+        assert _anchors(page, chunk_size) == expected
+
+
+def test_anchor_after_oversized_partial_tag():
+    # an anchor without an href is never completed, it is followed by more
+    # than _MAX_ANCHOR_TAIL bytes before the next anchor starts
+    prefix = b'<html><a name="top">' + b'x' * (_MAX_ANCHOR_TAIL + 10)
+    page = prefix + b'<a href="pkg-1.0.tar.gz">pkg-1.0.tar.gz</a></html>'
+    expected = [('pkg-1.0.tar.gz', 'pkg-1.0.tar.gz')]
+    assert _anchors(page, len(page)) == expected
+    # chunk boundaries inside the start of the anchor tag
+    for split in range(len(prefix) - 1, len(prefix) + 10):
+        chunks = [page[:split], page[split:]]
+        assert list(_iter_anchors(chunks)) == expected, split
@@ -0,0 +1,59 @@
+""" Tests of GitRepo object reads against scratch repositories. """
+
+import subprocess
+import time
+
+import pytest
+
+from conda_recipe_tools.git import GitRepo
+
+
+def git(path, *args):
+    out = subprocess.run(
+        ['git', '-C', str(path), '-c', 'user.name=test',
+         '-c', 'user.email=test@example.com'] + list(args),
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return out.stdout.decode('utf-8')
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / 'repo'
+    (path / 'recipe').mkdir(parents=True)
+    git(path, 'init', '-q', '-b', 'master')
+    (path / 'recipe' / 'meta.yaml').write_text('package:\n  name: foo\n')
+    (path / 'with space.txt').write_text('spaced\n')
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '-m', 'initial')
+    return path
+
+
+def test_read_blob(repo):
+    with GitRepo(str(repo)) as r:
+        assert r.read_blob('HEAD', 'recipe/meta.yaml') == \
+            b'package:\n  name: foo\n'
+        assert r.read_blob('HEAD', 'with space.txt') == b'spaced\n'
+        assert [e[1] for e in r.read_tree('HEAD')] == [
+            'recipe', 'with space.txt']
+
+
+def test_missing_names_with_spaces(repo):
+    with GitRepo(str(repo)) as r:
+        assert r.read_object('HEAD:no such file') == (None, None)
+        assert r.read_blob('HEAD', 'a b c d') is None
+        # the stream is still in step with the requests
+        assert r.read_blob('HEAD', 'recipe/meta.yaml') == \
+            b'package:\n  name: foo\n'
+
+
+def test_read_honours_deadline(repo, monkeypatch):
+    r = GitRepo(str(repo))
+    # a cat-file process which never answers
+    monkeypatch.setattr(r, '_start_cat_file', lambda: subprocess.Popen(
+        ['sleep', '60'], stdin=subprocess.PIPE, stdout=subprocess.PIPE))
+    r.deadline = time.monotonic() + 0.5
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        r.read_object('HEAD')
+    assert time.monotonic() - start < 10
+    r.close()
@@ -0,0 +1,130 @@
+""" Compare the pure Python git backend with git on scratch repositories. """
+
+import hashlib
+import os
+import subprocess
+
+import pytest
+
+from conda_recipe_tools.git_backend import BackendUnsupported, PythonBackend
+
+
+def git(path, *args):
+    out = subprocess.run(
+        ['git', '-C', str(path), '-c', 'user.name=test',
+         '-c', 'user.email=test@example.com'] + list(args),
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return out.stdout.decode('utf-8')
+
+
+def ls_files_modified(path):
+    return sorted(git(path, 'ls-files', '-m').splitlines())
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / 'repo'
+    path.mkdir()
+    git(path, 'init', '-q', '-b', 'master')
+    git(path, 'remote', 'add', 'origin', 'https://example.com/repo.git')
+    (path / 'recipe').mkdir()
+    (path / 'recipe' / 'meta.yaml').write_text('package:\n  name: foo\n')
+    (path / 'recipe' / 'build.sh').write_text('make\n')
+    (path / 'README.md').write_text('readme\n')
+    os.symlink('README.md', str(path / 'link'))
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '-m', 'initial')
+    git(path, 'tag', 'v1.0')
+    git(path, 'update-ref', 'refs/remotes/origin/master', 'HEAD')
+    git(path, 'symbolic-ref', 'refs/remotes/origin/HEAD',
+        'refs/remotes/origin/master')
+    (path / 'README.md').write_text('readme, second version\n')
+    git(path, 'commit', '-q', '-am', 'second')
+    return path
+
+
+def test_rev_parse(repo):
+    backend = PythonBackend(str(repo))
+    for rev in ['HEAD', 'master', 'v1.0', 'origin/master', 'origin']:
+        assert backend.rev_parse(rev) == git(repo, 'rev-parse', rev).strip()
+
+
+def test_rev_parse_packed_refs(repo):
+    git(repo, 'pack-refs', '--all')
+    backend = PythonBackend(str(repo))
+    for rev in ['master', 'v1.0', 'origin/master']:
+        assert backend.rev_parse(rev) == git(repo, 'rev-parse', rev).strip()
+
+
+def test_list_refs(repo):
+    expected = {}
+    for line in git(repo, 'for-each-ref',
+                    '--format=%(objectname) %(refname)').splitlines():
+        sha, refname = line.split(' ', 1)
+        expected[refname] = sha
+    assert PythonBackend(str(repo)).list_refs() == expected
+
+
+def test_config_get(repo):
+    backend = PythonBackend(str(repo))
+    for key in ['remote.origin.url', 'core.bare']:
+        assert backend.config_get(key) == \
+            git(repo, 'config', '--get', key).strip()
+
+
+def test_ls_files_modified(repo):
+    backend = PythonBackend(str(repo))
+    assert backend.ls_files_modified() == ls_files_modified(repo) == []
+    (repo / 'recipe' / 'meta.yaml').write_text('package:\n  name: bar\n')
+    (repo / 'recipe' / 'build.sh').chmod(0o755)
+    (repo / 'README.md').unlink()
+    (repo / 'link').unlink()
+    os.symlink('recipe', str(repo / 'link'))
+    expected = ls_files_modified(repo)
+    assert expected == [
+        'README.md', 'link', 'recipe/build.sh', 'recipe/meta.yaml']
+    assert sorted(backend.ls_files_modified()) == expected
+
+
+def test_same_content_is_not_modified(repo):
+    path = repo / 'recipe' / 'meta.yaml'
+    path.write_text(path.read_text())
+    os.utime(str(path), (0, 0))
+    assert ls_files_modified(repo) == []
+    assert PythonBackend(str(repo)).ls_files_modified() == []
+
+
+def test_optional_extensions_are_ignored(repo):
+    git(repo, 'update-index', '--untracked-cache')
+    git(repo, 'status', '--porcelain')
+    with open(str(repo / '.git' / 'index'), 'rb') as f:
+        assert b'UNTR' in f.read()
+    (repo / 'README.md').write_text('changed\n')
+    assert PythonBackend(str(repo)).ls_files_modified() == \
+        ls_files_modified(repo) == ['README.md']
+
+
+def test_split_index_is_unsupported(repo):
+    git(repo, 'update-index', '--split-index')
+    with pytest.raises(BackendUnsupported):
+        PythonBackend(str(repo)).ls_files_modified()
+
+
+def test_sparse_index_is_unsupported(repo):
+    git(repo, 'sparse-checkout', 'init', '--cone', '--sparse-index')
+    git(repo, 'sparse-checkout', 'set', 'other')
+    with pytest.raises(BackendUnsupported):
+        PythonBackend(str(repo)).ls_files_modified()
+
+
+# lowercase extensions are mandatory, uppercase ones optional but unknown
+@pytest.mark.parametrize('signature', [b'abcd', b'ZZZZ'])
+def test_unknown_extension_is_unsupported(repo, signature):
+    index_path = str(repo / '.git' / 'index')
+    with open(index_path, 'rb') as f:
+        data = f.read()[:-20]
+    data += signature + (4).to_bytes(4, 'big') + b'\0' * 4
+    with open(index_path, 'wb') as f:
+        f.write(data + hashlib.sha1(data).digest())
+    with pytest.raises(BackendUnsupported):
+        PythonBackend(str(repo)).ls_files_modified()
@@ -0,0 +1,119 @@
+""" Tests of the shared object store against local bare repositories. """
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conda_recipe_tools.cli import crt
+from conda_recipe_tools.git import GitRepo
+from conda_recipe_tools.object_store import (
+    DEFAULT_STORE_PATH, ObjectStore, bootstrap_feedstock)
+from conda_recipe_tools.repodata import CRT_CACHE_DIR
+
+NAME = 'foo-feedstock'
+
+
+def git(path, *args):
+    out = subprocess.run(
+        ['git', '-C', str(path), '-c', 'user.name=test',
+         '-c', 'user.email=test@example.com'] + list(args),
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return out.stdout.decode('utf-8')
+
+
+def local_object_count(path):
+    """ number of objects stored in the repository itself """
+    counts = dict(
+        line.split(': ') for line in
+        git(path, 'count-objects', '-v').splitlines())
+    return int(counts['count']) + int(counts['in-pack'])
+
+
+def make_upstream(tmp_path, org, commits):
+    """ create a bare repository tmp_path/org/NAME with commits commits """
+    work = tmp_path / 'work' / org
+    work.mkdir(parents=True)
+    git(work, 'init', '-q', '-b', 'master')
+    for i in range(commits):
+        (work / 'file').write_text('{} {}\n'.format(org, i))
+        git(work, 'add', 'file')
+        git(work, 'commit', '-q', '-m', 'commit {}'.format(i))
+    bare = tmp_path / org / NAME
+    subprocess.run(
+        ['git', 'clone', '-q', '--bare', str(work), str(bare)], check=True)
+    return bare
+
+
+@pytest.fixture
+def upstreams(tmp_path):
+    make_upstream(tmp_path, 'origin_org', 3)
+    make_upstream(tmp_path, 'other_org', 2)
+    # file:// transfers packs like a remote, plain paths copy loose objects
+    return 'file://' + str(tmp_path / '{org}' / '{name}')
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ObjectStore(str(tmp_path / 'store.git')).init()
+
+
+def test_init_never_prunes(store):
+    assert store.config_get('gc.pruneExpire') == 'never'
+    assert store.config_get('gc.auto') == '0'
+
+
+def test_bootstrap_new_clone(tmp_path, upstreams, store):
+    path = str(tmp_path / 'feedstocks' / NAME)
+    repo = bootstrap_feedstock(
+        store, path, ['origin_org', 'other_org'], upstreams)
+    refs = store.list_refs('refs/feedstocks/')
+    assert set(refs) == {
+        'refs/feedstocks/origin_org/{}/heads/master'.format(NAME),
+        'refs/feedstocks/other_org/{}/heads/master'.format(NAME)}
+    assert repo.alternates() == [os.path.abspath(store.objects_dir)]
+    assert repo.rev_parse('HEAD') == \
+        refs['refs/feedstocks/origin_org/{}/heads/master'.format(NAME)]
+    # every object is borrowed from the store
+    assert local_object_count(path) == 0
+    git(path, 'fsck', '--no-dangling')
+
+
+def test_bootstrap_existing_clone(tmp_path, upstreams, store):
+    path = tmp_path / 'feedstocks' / NAME
+    subprocess.run(
+        ['git', 'clone', '-q', upstreams.format(org='origin_org', name=NAME),
+         str(path)], check=True)
+    assert local_object_count(path) > 0
+    repo = bootstrap_feedstock(store, str(path), ['origin_org'], upstreams)
+    assert repo.alternates() == [os.path.abspath(store.objects_dir)]
+    assert local_object_count(path) == 0
+    git(path, 'fsck', '--no-dangling')
+    # attaching again does not duplicate the alternate
+    repo.add_alternate(store.objects_dir)
+    assert GitRepo(str(path)).alternates() == [
+        os.path.abspath(store.objects_dir)]
+
+
+def test_gc_keeps_borrowed_objects(tmp_path, upstreams, store, monkeypatch):
+    path = tmp_path / 'feedstocks' / NAME
+    bootstrap_feedstock(store, str(path), ['origin_org'], upstreams)
+    # a local commit, then drop every ref in the store so its objects are
+    # unreachable from the store
+    (path / 'file').write_text('local\n')
+    git(path, 'commit', '-q', '-am', 'local')
+    for ref in store.list_refs('refs/'):
+        git(store.path, 'update-ref', '-d', ref)
+    monkeypatch.setattr(sys, 'argv', [
+        'crt', '--store', store.path, 'gc',
+        '--base_dir', str(tmp_path / 'feedstocks'), NAME])
+    assert crt.main() == 0
+    git(path, 'fsck', '--no-dangling')
+    assert git(path, 'log', '--format=%s').splitlines() == [
+        'local', 'commit 2', 'commit 1', 'commit 0']
+
+
+def test_default_store_is_not_in_the_cache():
+    assert not os.path.abspath(DEFAULT_STORE_PATH).startswith(
+        os.path.abspath(CRT_CACHE_DIR))
@@ -0,0 +1,142 @@
+""" Tests of the source cache with a fake HTTP server. """
+
+import fcntl
+import hashlib
+import os
+import time
+
+import pytest
+import requests
+
+from conda_recipe_tools import source_cache
+from conda_recipe_tools.source_cache import (
+    _partial_path, cached_digests, fetch_source, prune_sources)
+
+URL = 'https://example.com/foo-1.0.tar.gz'
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.ok = status_code < 400
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(response=self)
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+
+class FakeServer(object):
+    """ Serve one URL with an ETag, answering conditional HEAD requests. """
+
+    def __init__(self, content, etag):
+        self.content = content
+        self.etag = etag
+        self.gets = 0
+        self.heads = 0
+
+    def get(self, url, stream, timeout, headers):
+        self.gets += 1
+        return FakeResponse(200, self.content, {'ETag': self.etag})
+
+    def head(self, url, headers, allow_redirects, timeout):
+        self.heads += 1
+        if headers.get('If-None-Match') == self.etag:
+            return FakeResponse(304)
+        return FakeResponse(200, headers={'ETag': self.etag})
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer(b'version one', '"1"')
+    monkeypatch.setattr(source_cache.requests, 'get', server.get)
+    monkeypatch.setattr(source_cache.requests, 'head', server.head)
+    return server
+
+
+def expire(cache_dir):
+    """ make the record of URL due for revalidation """
+    record = cached_digests(URL, cache_dir)
+    record['checked_at'] -= source_cache.REVALIDATE_AFTER + 1
+    source_cache.write_json_atomic(
+        {k: v for k, v in record.items() if k != 'path'},
+        source_cache._record_path(URL, cache_dir))
+
+
+def test_fetch_records_validators(tmp_path, server):
+    record = fetch_source(URL, str(tmp_path))
+    assert record['sha256'] == hashlib.sha256(b'version one').hexdigest()
+    assert record['etag'] == '"1"'
+    assert fetch_source(URL, str(tmp_path)) == record
+    # recently checked records are used without a request
+    assert (server.gets, server.heads) == (1, 0)
+
+
+def test_unchanged_source_is_not_downloaded(tmp_path, server):
+    record = fetch_source(URL, str(tmp_path))
+    expire(str(tmp_path))
+    assert fetch_source(URL, str(tmp_path))['sha256'] == record['sha256']
+    assert (server.gets, server.heads) == (1, 1)
+    # the revalidation is recorded
+    assert fetch_source(URL, str(tmp_path))['sha256'] == record['sha256']
+    assert (server.gets, server.heads) == (1, 1)
+
+
+def test_changed_source_is_downloaded(tmp_path, server):
+    fetch_source(URL, str(tmp_path))
+    server.content, server.etag = b'version one, re-tagged', '"2"'
+    expire(str(tmp_path))
+    record = fetch_source(URL, str(tmp_path))
+    assert record['sha256'] == \
+        hashlib.sha256(b'version one, re-tagged').hexdigest()
+    assert record['etag'] == '"2"'
+    assert server.gets == 2
+
+
+def test_without_revalidate(tmp_path, server):
+    record = fetch_source(URL, str(tmp_path))
+    server.content, server.etag = b'version two', '"2"'
+    expire(str(tmp_path))
+    assert fetch_source(URL, str(tmp_path), revalidate=False)['sha256'] == \
+        record['sha256']
+    assert (server.gets, server.heads) == (1, 0)
+
+
+def test_prune_removes_lock_files(tmp_path, server):
+    cache_dir = str(tmp_path)
+    fetch_source(URL, cache_dir)
+    lock_path = _partial_path(URL, cache_dir) + '.lock'
+    assert os.path.exists(lock_path)
+    prune_sources(cache_dir)
+    assert not os.path.exists(lock_path)
+    assert cached_digests(URL, cache_dir)['path'] is not None
+
+
+def test_prune_stale_partial_downloads(tmp_path):
+    cache_dir = str(tmp_path)
+    partial_dir = tmp_path / 'partial'
+    partial_dir.mkdir()
+    old = time.time() - 100
+    for name in ['stale', 'active']:
+        part = partial_dir / (name + '.part')
+        part.write_bytes(b'12345')
+        os.utime(str(part), (old, old))
+        (partial_dir / (name + '.part.lock')).touch()
+    with open(str(partial_dir / 'active.part.lock'), 'a') as lock_file:
+        # a download still in progress in another process
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert prune_sources(cache_dir, max_age=10) == (2, 5)
+    assert sorted(os.listdir(str(partial_dir))) == [
+        'active.part', 'active.part.lock']